@@ -0,0 +1,204 @@
+import argparse
+import configparser
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+from BenchmarkFixtures import FakeDropbox, FixtureServer, build_synthetic_fixtures, record_fixtures
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+
+PAPERS = ("prajasakthi", "andhra_prabha", "surya", "visalandra", "vaartha", "eenadu", "sakshi", "andhra_jyothi")
+
+
+def write_benchmark_config(work_directory, base_url):
+    """
+    Copies config.properties into the work directory with every paper url pointing to the fixture server.
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(REPOSITORY, 'config.properties'))
+    for url_key, url in config['newspapers'].items():
+        parsed = urlparse(url)
+        config['newspapers'][url_key] = url.replace(f"{parsed.scheme}://{parsed.netloc}", base_url, 1)
+    config['dropbox']['access.token'] = "benchmark"
+    # The fixture server stands in for every site at once, the per-site limits don't apply to it
+    if config.has_section('rate_limit'):
+        config['rate_limit']['enabled'] = "false"
+    with open(os.path.join(work_directory, 'config.properties'), 'w') as f:
+        config.write(f)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in KB on Linux, Chrome and chromedriver are counted in the children
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def run_round(base_url, paper_names):
+    """
+    Runs the real NewspaperDownloader flows against the fixture server in a fresh work directory,
+    so that no capture cache or upload manifest of an earlier round is reused.
+    Meant to run in its own process, see measure_round.
+    """
+    work_directory = tempfile.mkdtemp(prefix="benchmark-")
+    current_directory = os.getcwd()
+    try:
+        write_benchmark_config(work_directory, base_url)
+        os.chdir(work_directory)
+        # Imported from the work directory, every module reads its config.properties from there
+        from Metrics import metrics
+        from RateLimiter import rate_limiter
+        from RetryPolicy import latency_history
+        from main import NewspaperDownloader
+
+        # Already imported with the fixtures, before the work directory config existed
+        metrics.reset()
+        latency_history.load()
+        rate_limiter.load()
+        fake_dropbox = FakeDropbox()
+        started = time.perf_counter()
+        NewspaperDownloader(dropbox_client=fake_dropbox).execute_download(paper_names)
+        wall_seconds = time.perf_counter() - started
+
+        # Latency of a page: everything done for it, from its fetch or navigation to its merge
+        page_seconds = {}
+        for record in metrics.report()["stages"]:
+            if record["page"] is not None:
+                key = (record["paper"], record["page"])
+                page_seconds[key] = page_seconds.get(key, 0) + record["seconds"]
+        latencies = list(page_seconds.values())
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+            "peak_children_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "time_to_first_page": metrics.first_page_seconds,
+            "pages": len(latencies),
+            "page_latency": {
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "max": round(max(latencies, default=0.0), 3),
+            },
+            "output_bytes": fake_dropbox.uploaded_bytes,
+            "outputs": {path: len(data) for path, data in sorted(fake_dropbox.files.items())},
+            "stages": metrics.summary(),
+        }
+    finally:
+        os.chdir(current_directory)
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+
+def measure_round(base_url, paper_names):
+    # A fresh interpreter per round, the peak RSS is a peak over the process lifetime
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_round, base_url, paper_names).result()
+
+
+def compare_with_baseline(result, baseline, tolerance):
+    """
+    Returns the regressions of result against a previous report: slower wall time or page latency,
+    or a different output size.
+    """
+    regressions = []
+    for name, current, previous in (
+            ("wall time", result["wall_seconds"], baseline["wall_seconds"]),
+            ("time to first page", result["time_to_first_page"], baseline.get("time_to_first_page")),
+            ("p95 page latency", result["page_latency"]["p95"], baseline["page_latency"]["p95"])):
+        if previous and current is not None and current > previous * (1 + tolerance):
+            regressions.append(f"{name} went from {previous:.2f}s to {current:.2f}s")
+    if result["output_bytes"] != baseline["output_bytes"]:
+        regressions.append(f"output size went from {baseline['output_bytes']} to {result['output_bytes']} bytes")
+    return regressions
+
+
+def print_result(result):
+    print(f"{'Round':<6} {'Wall (s)':>9} {'First (s)':>10} {'Pages':>6} {'p50 (s)':>8} {'p95 (s)':>8} {'Max (s)':>8} "
+          f"{'RSS (MB)':>9} {'Chrome RSS (MB)':>16} {'Output (MB)':>12}")
+    for number, round_result in enumerate(result["rounds"], start=1):
+        latency = round_result["page_latency"]
+        print(f"{number:<6} {round_result['wall_seconds']:>9.2f} {round_result['time_to_first_page'] or 0:>10.2f} "
+              f"{round_result['pages']:>6} {latency['p50']:>8.2f} "
+              f"{latency['p95']:>8.2f} {latency['max']:>8.2f} {round_result['peak_rss_mb']:>9.1f} "
+              f"{round_result['peak_children_rss_mb']:>16.1f} {round_result['output_bytes'] / (1024 * 1024):>12.2f}")
+
+
+def run_benchmark(args):
+    # Read before anything is written, the new report may replace it
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    fixtures = os.path.abspath(args.fixtures or tempfile.mkdtemp(prefix="fixtures-"))
+    if not os.path.exists(os.path.join(fixtures, "routes.json")):
+        config = configparser.ConfigParser()
+        config.read(os.path.join(REPOSITORY, 'config.properties'))
+        build_synthetic_fixtures(fixtures, config['newspapers'], args.pages, args.page_kb)
+
+    rounds = []
+    with FixtureServer(fixtures, args.latency_ms) as server:
+        print(f"Replaying {fixtures} on {server.base_url}")
+        for _ in range(args.rounds):
+            rounds.append(measure_round(server.base_url, args.papers))
+
+    # The median round is reported, the others are kept for reference
+    result = dict(sorted(rounds, key=lambda round_result: round_result["wall_seconds"])[len(rounds) // 2])
+    result["papers"] = args.papers
+    result["rounds"] = rounds
+    print_result(result)
+    with open(args.report, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Benchmark report written to {args.report}")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the paper downloads against recorded e-paper fixtures.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="replay the fixtures through the download flows (default)")
+    run_parser.add_argument("--fixtures", help="fixtures directory, synthetic fixtures are built when it is empty")
+    run_parser.add_argument("--papers", nargs="+", choices=PAPERS, default=list(PAPERS))
+    run_parser.add_argument("--pages", type=int, default=8, help="pages per synthetic edition")
+    run_parser.add_argument("--page-kb", type=int, default=300, help="size of a synthetic page")
+    run_parser.add_argument("--latency-ms", type=int, default=50, help="delay added to every fixture response")
+    run_parser.add_argument("--rounds", type=int, default=1)
+    run_parser.add_argument("--report", default="benchmark_report.json")
+    run_parser.add_argument("--baseline", help="earlier report to compare with, exits with 1 on a regression")
+    run_parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+
+    record_parser = subparsers.add_parser("record", help="record live pages into a fixtures directory")
+    record_parser.add_argument("--fixtures", required=True)
+    record_parser.add_argument("urls", nargs="+")
+
+    args = parser.parse_args(sys.argv[1:] if len(sys.argv) > 1 and sys.argv[1] in ("run", "record", "-h", "--help")
+                             else ["run"] + sys.argv[1:])
+    if args.command == "record":
+        record_fixtures(args.urls, args.fixtures)
+        return 0
+    args.report = os.path.abspath(args.report)
+    if args.baseline:
+        args.baseline = os.path.abspath(args.baseline)
+    return run_benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
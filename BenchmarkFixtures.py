@@ -0,0 +1,335 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
+
+from HttpDownloader import get_http_session
+from LazyImport import LazyModule
+
+dropbox = LazyModule("dropbox")
+
+ROUTES_FILE = "routes.json"
+
+# dd/mm/yyyy and yyyy-mm-dd dates are replaced in the routes, so recorded editions are replayed on any day
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}")
+
+# 8x8 gray JPEG, padded with comment segments up to the wanted page size
+FIXTURE_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1x"
+    "eXBkeFxlZ2P/wAALCAAIAAgBAREA/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIh"
+    "MUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWG"
+    "h4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/9oACAEBAAA/AOkr/9k="
+)
+
+CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".pdf": "application/pdf", ".jpg": "image/jpeg"}
+
+
+def route_key(path_and_query):
+    """
+    Key of a request in the routes: the path and the sorted query parameters, with the dates replaced.
+    """
+    parsed = urlparse(path_and_query)
+    query = sorted((name, DATE_PATTERN.sub("{date}", value)) for name, value in parse_qsl(parsed.query))
+    path = DATE_PATTERN.sub("{date}", unquote(parsed.path)) or "/"
+    return f"{path}?{urlencode(query)}" if query else path
+
+
+def load_routes(directory):
+    routes_file = os.path.join(directory, ROUTES_FILE)
+    if not os.path.exists(routes_file):
+        return {}
+    with open(routes_file) as f:
+        return json.load(f)
+
+
+def save_routes(directory, routes):
+    with open(os.path.join(directory, ROUTES_FILE), 'w') as f:
+        json.dump(routes, f, indent=2, sort_keys=True)
+
+
+class FixtureServer:
+    """
+    Replays the recorded responses of a fixtures directory on a local port. Range requests are
+    honoured like the e-paper CDNs do, and latency_ms delays every response to mimic the network.
+    """
+
+    def __init__(self, directory, latency_ms=0, port=0):
+        self.directory = directory
+        self.routes = load_routes(directory)
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                route = server.routes.get(route_key(self.path))
+                if route is None:
+                    self.send_error(404)
+                    return
+                with open(os.path.join(server.directory, route["file"]), 'rb') as f:
+                    body = f.read()
+
+                status, start = 200, 0
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    if start >= len(body):
+                        self.send_error(416)
+                        return
+                    status = 206
+                self.send_response(status)
+                self.send_header("Content-Type", route.get("content_type", "application/octet-stream"))
+                self.send_header("Content-Length", str(len(body) - start))
+                self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                self.end_headers()
+                self.wfile.write(body[start:])
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixtures", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def add_fixture(directory, routes, path_and_query, body, content_type):
+    file_name = hashlib.sha1(route_key(path_and_query).encode()).hexdigest()[:16]
+    file_name += next((ext for ext, value in CONTENT_TYPES.items() if value.split(";")[0] in content_type), "")
+    with open(os.path.join(directory, file_name), 'wb') as f:
+        f.write(body)
+    routes[route_key(path_and_query)] = {"file": file_name, "content_type": content_type}
+
+
+def record_fixtures(urls, directory):
+    """
+    Records the live responses of urls into directory. Links to the recorded hosts are made relative,
+    so that the pages point back to the fixture server when they are replayed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    routes = load_routes(directory)
+    hosts = {f"{urlparse(url).scheme}://{urlparse(url).netloc}" for url in urls}
+    session = get_http_session()
+    for url in urls:
+        try:
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+        except Exception as err:
+            print(f"Couldn't record {url}: {err}")
+            continue
+        content_type = response.headers.get("Content-Type", "application/octet-stream")
+        body = response.content
+        if content_type.startswith("text/"):
+            text = response.text
+            for host in hosts:
+                text = text.replace(host, "")
+            body = text.encode(response.encoding or "utf-8")
+        parsed = urlparse(url)
+        add_fixture(directory, routes, parsed.path + (f"?{parsed.query}" if parsed.query else ""), body,
+                    content_type)
+        print(f"Recorded {url}")
+    save_routes(directory, routes)
+
+
+def make_pdf(pages, size_kb):
+    """
+    Builds a PDF of blank pages, padded with content stream comments to about size_kb. The pages have
+    a font so that they pass as captured pages.
+    """
+    padding = b"% " + b"x" * 76 + b"\n"
+    content = padding * max(1, size_kb * 1024 // pages // len(padding))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + page * 2} 0 R" for page in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    for page in range(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {4 + page * 2} 0 R "
+                       f"/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>"
+                       .encode())
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(pdf)
+
+
+def make_jpeg(size_kb):
+    # Comment segments right after the SOI marker, skipped by every decoder
+    jpeg = bytearray(FIXTURE_JPEG[:2])
+    remaining = size_kb * 1024
+    while remaining > 0:
+        segment = min(remaining, 65533)
+        jpeg += b"\xff\xfe" + (segment + 2).to_bytes(2, 'big') + b"\0" * segment
+        remaining -= segment
+    return bytes(jpeg + FIXTURE_JPEG[2:])
+
+
+def _path(url_template, paper_date=None):
+    # Server side path and query of a paper url of config.properties
+    url = url_template.replace("{}", paper_date, 1) if paper_date else url_template
+    parsed = urlparse(url)
+    return parsed.path + (f"?{parsed.query}" if parsed.query else "")
+
+
+def _html(body, script=""):
+    return f"<!DOCTYPE html><html><head><script>{script}</script></head><body>{body}</body></html>".encode()
+
+
+def build_synthetic_fixtures(directory, newspapers, pages=8, page_kb=300):
+    """
+    Writes a fixture edition of every paper of the [newspapers] urls, shaped like the real sites as far
+    as the download flows are concerned (page links, pgid redirects, Next_Page buttons, pdf buttons...).
+    """
+    os.makedirs(directory, exist_ok=True)
+    routes = {}
+    sample_date = date.today().strftime("%Y-%m-%d")
+    pdf_page = make_pdf(1, page_kb)
+    jpeg_page = make_jpeg(page_kb)
+
+    # Prajasakti: a page view per pg_no, each linking to the pdf of its page
+    for url_key in ('prajasakthi_main_paper_url', 'prajasakthi_district_paper_url'):
+        template = newspapers[url_key]
+        page_links = "".join(f"<a href='{_path(template, sample_date).replace('{}', str(page_no))}'>{page_no}</a>"
+                             for page_no in range(1, pages + 1))
+        for page_no in range(1, pages + 1):
+            pdf_path = f"/fixtures/{url_key}/{page_no}.pdf"
+            page_url = _path(template, sample_date).replace("{}", str(page_no))
+            add_fixture(directory, routes, page_url, _html(f"{page_links}<a href='{pdf_path}'>PDF</a>"),
+                        CONTENT_TYPES[".html"])
+            add_fixture(directory, routes, pdf_path, pdf_page, CONTENT_TYPES[".pdf"])
+
+    # Page by page papers: the edition redirects to its first pgid page, every page shows its scan
+    for url_key in ('sakshi_paper_url', 'abn_paper_url', 'visalandra_paper_url', 'andhra_prabha_paper_url',
+                    'eenadu_paper_url'):
+        edition_path = _path(newspapers[url_key], "01/01/2026")
+        redirect = "if (!/[?&]pgid=/.test(location.search)) location.replace(location.href + '&pgid=1');"
+        add_fixture(directory, routes, edition_path, _html("", redirect), CONTENT_TYPES[".html"])
+        image_path = f"/fixtures/{url_key}/page.jpg"
+        add_fixture(directory, routes, image_path, jpeg_page, CONTENT_TYPES[".jpg"])
+        options = "".join(f"<option value='{page_id}'>{page_id}</option>" for page_id in range(1, pages + 1))
+        for page_id in range(1, pages + 1):
+            next_id = page_id + 1 if page_id < pages else page_id
+            page_path = f"{edition_path}&pgid={page_id}"
+            next_path = f"{edition_path}&pgid={next_id}"
+            body = (f"<button id='gdprContinue' onclick='this.remove()'>OK</button>"
+                    f"<div class='social_share_box_Container'>Share</div>"
+                    f"<select id='myPageList'>{options}</select>"
+                    + "".join(f"<a href='{edition_path}&pgid={other_id}'>{other_id}</a>"
+                              for other_id in range(1, pages + 1) if other_id != page_id)
+                    + f"<a id='Prev_Page' href='{edition_path}&pgid={max(page_id - 1, 1)}'>Prev</a>"
+                    f"<a id='Next_Page' href='{next_path}'>Next</a>"
+                    f"<span data-original-title='Next Page' onclick=\"location.href='{next_path}'\">Next</span>"
+                    f"<img src='{image_path}' width='800' height='1200'>")
+            add_fixture(directory, routes, page_path, _html(body), CONTENT_TYPES[".html"])
+
+    # Surya: an edition link per category, the edition page holds the pdf download button
+    for url_key, category in (('surya_main_paper_url', 8), ('surya_district_paper_url', 18)):
+        edition_path = f"/fixtures/surya/{category}.html"
+        pdf_path = f"/fixtures/surya/{category}.pdf"
+        edition_link = f"<a data-linktype='edition-link' data-cat_ids='{category}' href='{edition_path}'>Edition</a>"
+        add_fixture(directory, routes, _path(newspapers[url_key]), _html(edition_link), CONTENT_TYPES[".html"])
+        add_fixture(directory, routes, edition_path, _html(f"<a class='btn-pdfdownload' href='{pdf_path}'>PDF</a>"),
+                    CONTENT_TYPES[".html"])
+        add_fixture(directory, routes, pdf_path, make_pdf(pages, pages * page_kb), CONTENT_TYPES[".pdf"])
+
+    # Vaartha: the home page links the Ongole edition, which holds the pdf download button
+    add_fixture(directory, routes, _path(newspapers['vaartha_home_url']),
+                _html("<a href='/fixtures/vaartha/ongole.html'>Ongole main</a>"), CONTENT_TYPES[".html"])
+    add_fixture(directory, routes, "/fixtures/vaartha/ongole.html",
+                _html("<a class='btn-pdfdownload' href='/fixtures/vaartha/ongole.pdf'>PDF</a>"),
+                CONTENT_TYPES[".html"])
+    add_fixture(directory, routes, "/fixtures/vaartha/ongole.pdf", make_pdf(pages, pages * page_kb),
+                CONTENT_TYPES[".pdf"])
+
+    save_routes(directory, routes)
+    print(f"Built {len(routes)} fixtures in {directory}")
+
+
+def _api_error(error):
+    return dropbox.exceptions.ApiError("fake", error, None, None)
+
+
+class FakeDropbox:
+    """
+    In memory stand-in for the dropbox.Dropbox client, implementing the calls used by DropboxManager.
+    """
+
+    def __init__(self):
+        self.folders = set()
+        self.files = {}
+        self._sessions = {}
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def files_create_folder_v2(self, path):
+        self.folders.add(path)
+
+    def files_get_metadata(self, path):
+        if path in self.files:
+            block_hashes = hashlib.sha256()
+            data = self.files[path]
+            for start in range(0, len(data), 4 * 1024 * 1024):
+                block_hashes.update(hashlib.sha256(data[start:start + 4 * 1024 * 1024]).digest())
+            return SimpleNamespace(path_display=path, size=len(data), content_hash=block_hashes.hexdigest())
+        if path in self.folders:
+            return SimpleNamespace(path_display=path)
+        raise _api_error(dropbox.files.GetMetadataError.path(dropbox.files.LookupError.not_found))
+
+    def files_delete_v2(self, path):
+        self.folders.discard(path)
+        for file_path in [file_path for file_path in self.files if file_path.startswith(f"{path}/")]:
+            del self.files[file_path]
+
+    def files_upload_session_start(self, data, close=False):
+        with self._lock:
+            self._ids += 1
+            session_id = f"session-{self._ids}"
+            self._sessions[session_id] = bytearray(data)
+        return SimpleNamespace(session_id=session_id)
+
+    def files_upload_session_append_v2(self, data, cursor, close=False):
+        session = self._sessions.get(cursor.session_id)
+        if session is None:
+            raise _api_error(dropbox.files.UploadSessionLookupError.not_found)
+        if cursor.offset != len(session):
+            raise _api_error(dropbox.files.UploadSessionLookupError.incorrect_offset(
+                dropbox.files.UploadSessionOffsetError(correct_offset=len(session))))
+        session += data
+
+    def files_upload_session_finish_batch_v2(self, entries):
+        results = []
+        for entry in entries:
+            self.files[entry.commit.path] = bytes(self._sessions.pop(entry.cursor.session_id))
+            results.append(SimpleNamespace(is_success=lambda: True, get_failure=lambda: None))
+        return SimpleNamespace(entries=results)
+
+    @property
+    def uploaded_bytes(self):
+        return sum(len(data) for data in self.files.values())
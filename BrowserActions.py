@@ -0,0 +1,155 @@
+import time
+
+from selenium.common import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from BrowserProfiles import consent_cookies
+from RateLimiter import rate_limiter
+from RequestBlocker import request_blocker
+from RetryPolicy import latency_history
+
+
+def wait_until(driver, condition, operation, default_timeout, required=True):
+    """
+    WebDriverWait(driver, timeout).until(condition) with the timeout learned from the site's history
+    of the operation. Timeouts of required waits are recorded too, so that slow sites get longer ones,
+    while optional elements (popups, ads) only learn from the times they showed up, and are only looked
+    for briefly once they stopped showing up on the site, but for the odd full look in case they came back.
+    """
+    missing = not required and latency_history.is_missing(operation)
+    timeout = latency_history.missing_timeout if missing else latency_history.timeout(operation, default_timeout)
+    started = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout).until(condition)
+    except TimeoutException:
+        if required:
+            latency_history.record(operation, timeout)
+        else:
+            latency_history.record_presence(operation, False, brief=missing)
+        raise
+    latency_history.record(operation, time.perf_counter() - started)
+    if not required:
+        latency_history.record_presence(operation, True)
+    return result
+
+
+def accept_cookies(cookie, driver):
+    # The consent given on an earlier run has been restored, the banner doesn't show up
+    if consent_cookies.is_restored(driver):
+        return
+    try:
+        accept_cookies_button = wait_until(driver, EC.element_to_be_clickable((By.ID, cookie)), "cookies", 10,
+                                           required=False)
+        cookies_before = driver.get_cookies()
+        accept_cookies_button.click()
+        consent_cookies.save(driver, cookies_before)
+    except Exception as e:
+        print(f"Could not find or click 'Accept Cookies' button: {e}")
+
+
+def add_right_zero_to_elements(driver):
+    try:
+        # Locate and modify the "Next_Page" element
+        next_page_element = wait_until(driver, EC.presence_of_element_located((By.ID, "Next_Page")), "page_buttons", 10,
+                                       required=False)
+        driver.execute_script("arguments[0].style.right = '0px';", next_page_element)
+
+        # Locate and modify the "Prev_Page" element
+        prev_page_element = wait_until(driver, EC.presence_of_element_located((By.ID, "Prev_Page")), "page_buttons", 10,
+                                       required=False)
+        driver.execute_script("arguments[0].style.left = '0px';", prev_page_element)
+
+    except Exception as e:
+        print(f"Error modifying style: {e}")
+
+
+def add_right_zero(driver):
+    try:
+        # Wait for the element with id 'Next_Page' to be present
+        next_page_element = wait_until(driver, EC.presence_of_element_located((By.ID, "Next_Page")), "page_buttons", 10,
+                                       required=False)
+
+        # Execute JavaScript to add 'right: 0px' style
+        driver.execute_script("arguments[0].style.right = '0px';", next_page_element)
+
+    except Exception as e:
+        print(f"Error modifying style: {e}")
+
+
+def find_and_click_buttons(driver):
+    try:
+        # Wait for both buttons with id 'button-1' to be present
+        buttons = wait_until(driver, EC.presence_of_all_elements_located((By.ID, "button-1")), "popup", 10,
+                             required=False)
+
+        # Loop through found buttons and click based on text content
+        for button in buttons:
+            text = button.text
+            if text == "X":
+                button.click()
+            elif text == "x":
+                button.click()
+
+    except Exception as e:
+        print(f"Could not find or click buttons: {e}")
+
+
+def hide_social_share_button(driver):
+    try:
+        # Wait for the social share button to be present
+        social_share_button = wait_until(
+            driver, EC.presence_of_element_located((By.CLASS_NAME, "social_share_box_Container")), "social_share", 10,
+            required=False)
+
+        # Use JavaScript to hide the element
+        driver.execute_script("arguments[0].style.display = 'none';", social_share_button)
+        #print("Social share button hidden.")
+    except Exception as e:
+        print(f"Could not find or hide social share button: {e}")
+
+
+def open_url(driver, url):
+    # Every page load counts against the site's rate limit, whichever worker it comes from
+    request_blocker.apply(driver, url)
+    consent_cookies.restore(driver, url)
+    with rate_limiter.request(url):
+        driver.get(url)
+
+
+def reload_current_page(driver):
+    with rate_limiter.request(driver.current_url):
+        driver.refresh()
+
+
+def load_page(driver, url):
+    open_url(driver, url)
+    wait_until(driver, EC.url_contains('pgid'), "load", 10)  # Wait until the current URL contains 'pgid'
+
+
+def navigate_to_next_eenadu_page(driver, next_url=None):
+    # Raises when the next page can't be opened, so that the navigation is retried
+    next_page = wait_until(driver, EC.element_to_be_clickable((By.XPATH, "//span[@data-original-title='Next Page']")),
+                           "navigate", 10)
+    rate_limiter.wait(driver.current_url)
+    next_page.click()
+
+
+def navigate_to_next_page(driver, next_url):
+    # A retry after a slow navigation must not click again, that would skip a page
+    with rate_limiter.request(next_url):
+        if driver.current_url == next_url:
+            next_page = wait_until(driver, EC.element_to_be_clickable((By.ID, 'Next_Page')), "navigate", 5)
+            next_page.click()
+            hide_social_share_button(driver)
+        wait_until(driver, lambda driver: driver.current_url != next_url, "navigate", 5)
+
+
+def skip_ads(driver):
+    try:
+        button = wait_until(driver, EC.presence_of_element_located((By.XPATH, "//button[text()='SKIP']")), "ads", 3,
+                            required=False)
+        button.click()
+    except Exception as err:
+        print(f"Exception in Skip ads: {err}")
@@ -0,0 +1,167 @@
+import configparser
+import json
+import os
+import shutil
+import threading
+import time
+from urllib.parse import urlparse
+
+from CdpClient import get_browser_cdp
+
+# Only the caches are removed when a profile is pruned, the cookies and storage are kept
+CACHE_DIRECTORIES = ("Default/Cache", "Default/Code Cache", "Default/GPUCache", "Default/Service Worker/CacheStorage",
+                     "GrShaderCache", "ShaderCache")
+
+LAST_USED_FILE = "last_used"
+
+
+def directory_size(directory):
+    size = 0
+    for root, directories, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class BrowserProfiles:
+    """
+    Persistent Chrome profiles (user-data-dir) reused across runs, one per browser of the pool as a
+    profile can't be opened by two browsers at once. Warm runs get the sites' scripts, fonts and CSS from
+    the disk cache, capped at disk_cache_mb, and keep the consent cookies.
+    A profile is pruned before use: its caches are cleared once it has been idle for max_idle_days or
+    has grown past max_profile_mb, and it is started over if that is not enough.
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.enabled = config.getboolean('browser_profile', 'enabled', fallback=False)
+        self.directory = os.path.abspath(config.get('browser_profile', 'directory', fallback='browser_profiles'))
+        self.disk_cache_mb = config.getint('browser_profile', 'disk_cache_mb', fallback=200)
+        self.max_profile_mb = config.getint('browser_profile', 'max_profile_mb', fallback=400)
+        self.max_idle_days = config.getint('browser_profile', 'max_idle_days', fallback=7)
+        self._in_use = set()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns the directory of a profile no other browser is using, None when profiles are disabled.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            slot = 0
+            while slot in self._in_use:
+                slot += 1
+            self._in_use.add(slot)
+        profile_directory = os.path.join(self.directory, f"profile-{slot}")
+        try:
+            self.prune(profile_directory)
+        except OSError as err:
+            print(f"Error while pruning the browser profile: {profile_directory}: {err}")
+        return profile_directory
+
+    def release(self, profile_directory):
+        # Called once the browser has quit, so that it has written its cookies and cache
+        if profile_directory is None:
+            return
+        try:
+            os.makedirs(profile_directory, exist_ok=True)
+            with open(os.path.join(profile_directory, LAST_USED_FILE), 'w') as f:
+                f.write(str(time.time()))
+        except OSError as err:
+            print(f"Error while releasing the browser profile: {profile_directory}: {err}")
+        with self._lock:
+            self._in_use.discard(int(profile_directory.rsplit("-", 1)[1]))
+
+    def prune(self, profile_directory):
+        if not os.path.isdir(profile_directory):
+            return
+        last_used_file = os.path.join(profile_directory, LAST_USED_FILE)
+        last_used = os.path.getmtime(last_used_file) if os.path.exists(last_used_file) else 0
+        max_size = self.max_profile_mb * 1024 * 1024
+        idle = time.time() - last_used > self.max_idle_days * 24 * 3600
+        if not idle and directory_size(profile_directory) <= max_size:
+            return
+
+        for cache_directory in CACHE_DIRECTORIES:
+            shutil.rmtree(os.path.join(profile_directory, cache_directory), ignore_errors=True)
+        print(f"Cleared the caches of the browser profile {profile_directory}.")
+        if directory_size(profile_directory) > max_size:
+            shutil.rmtree(profile_directory, ignore_errors=True)
+            print(f"Started the browser profile {profile_directory} over, it was still too big.")
+
+
+class ConsentCookies:
+    """
+    Keeps the cookies a site sets when its consent banner is accepted and gives them back to every browser
+    before it opens the site, so the banner is only ever clicked once.
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.enabled = config.getboolean('browser_profile', 'enabled', fallback=False)
+        self.cookies_file = config.get('browser_profile', 'consent_cookies_file', fallback='consent_cookies.json')
+        self._lock = threading.Lock()
+        self._restored = set()
+        self._cookies = {}
+        if self.enabled and os.path.exists(self.cookies_file):
+            try:
+                with open(self.cookies_file) as f:
+                    self._cookies = json.load(f)
+            except ValueError:
+                print(f"Ignoring the unreadable consent cookies: {self.cookies_file}")
+
+    def save(self, driver, cookies_before=()):
+        """
+        Saves the cookies set by the consent, i.e. the ones which are not in cookies_before. Session cookies
+        are left out, they would be gone on the next run anyway.
+        """
+        if not self.enabled:
+            return
+        hostname = urlparse(driver.current_url).hostname
+        previous = {(cookie['name'], cookie['value']) for cookie in cookies_before}
+        cookies = [cookie for cookie in driver.get_cookies()
+                   if 'expiry' in cookie and (cookie['name'], cookie['value']) not in previous]
+        if not hostname or not cookies:
+            return
+        with self._lock:
+            self._cookies[hostname] = cookies
+            self._restored.add((driver.session_id, hostname))
+            try:
+                with open(self.cookies_file, 'w') as f:
+                    json.dump(self._cookies, f, indent=2)
+            except OSError as err:
+                print(f"Error while saving the consent cookies: {self.cookies_file}: {err}")
+
+    def restore(self, driver, url):
+        # Set through DevTools, selenium can only add cookies of the page currently open
+        hostname = urlparse(url).hostname
+        with self._lock:
+            cookies = [cookie for cookie in self._cookies.get(hostname, ()) if cookie['expiry'] > time.time()]
+        if not cookies:
+            return
+        try:
+            get_browser_cdp(driver).send("Network.setCookies", {"cookies": [
+                {"name": cookie['name'], "value": cookie['value'], "domain": cookie['domain'],
+                 "path": cookie.get('path', '/'), "secure": cookie.get('secure', False),
+                 "httpOnly": cookie.get('httpOnly', False), "expires": cookie['expiry']}
+                for cookie in cookies]}, target_id=driver.current_window_handle)
+            with self._lock:
+                self._restored.add((driver.session_id, hostname))
+        except Exception as err:
+            print(f"Couldn't restore the consent cookies of {hostname}: {err}")
+
+    def is_restored(self, driver):
+        with self._lock:
+            return (driver.session_id, urlparse(driver.current_url).hostname) in self._restored
+
+
+# Shared by every browser, the cookies are saved as soon as a consent banner is accepted
+consent_cookies = ConsentCookies()
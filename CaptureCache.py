@@ -0,0 +1,51 @@
+import configparser
+import os
+import shutil
+
+import PyPDF2
+
+
+class CaptureCache:
+    """
+    Keeps every captured page on disk by (paper, edition date, page number) until its paper has been
+    merged, so that a failed paper resumes from the missing pages instead of page 1.
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.directory = config.get('capture_cache', 'directory', fallback='capture_cache')
+        # Pages smaller than this are blank captures (page not rendered yet)
+        self.min_page_size = config.getint('capture_cache', 'min_page_size_kb', fallback=10) * 1024
+
+    def page_path(self, paper_name, edition_date, page_no):
+        paper_directory = os.path.join(self.directory, edition_date, paper_name)
+        os.makedirs(paper_directory, exist_ok=True)
+        return os.path.join(paper_directory, f"{page_no}.pdf")
+
+    def is_valid(self, page_path):
+        if not os.path.exists(page_path) or os.path.getsize(page_path) < self.min_page_size:
+            return False
+        try:
+            with open(page_path, 'rb') as f:
+                if f.read(5) != b"%PDF-":
+                    return False
+            reader = PyPDF2.PdfReader(page_path)
+            if len(reader.pages) < 1:
+                return False
+            # A page showing the scan or any text has something to draw
+            resources = reader.pages[0].get("/Resources")
+            resources = resources.get_object() if resources is not None else {}
+            return "/XObject" in resources or "/Font" in resources
+        except Exception as err:
+            print(f"Discarding the invalid page {page_path}: {err}")
+            return False
+
+    def clear(self, paper_name, edition_date):
+        shutil.rmtree(os.path.join(self.directory, edition_date, paper_name), ignore_errors=True)
+
+    def has_pages(self, paper_name, edition_date):
+        # Pages are left behind by a paper which was interrupted or merged with pages missing
+        paper_directory = os.path.join(self.directory, edition_date, paper_name)
+        return os.path.isdir(paper_directory) and any(name.endswith(".pdf") for name in os.listdir(paper_directory))
@@ -0,0 +1,285 @@
+import asyncio
+import base64
+import concurrent.futures
+import configparser
+import fnmatch
+import itertools
+import json
+import os
+import threading
+import urllib.request
+
+import websockets
+
+
+class CdpError(Exception):
+    pass
+
+
+class CdpClient:
+    """
+    asyncio client for the Chrome DevTools Protocol, talking to the browser websocket directly.
+    Commands are pipelined (many can be in flight at once) and every tab is driven through its own
+    flattened session, so several targets can be used at the same time.
+    """
+
+    def __init__(self, websocket_url):
+        self.websocket_url = websocket_url
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = []
+        self._sessions = {}
+        self._targets = {}
+        self._lifecycle = {}
+        self._documents = {}
+        self._waited_documents = {}
+        self._request_rules = {}
+        self._websocket = None
+        self._reader_task = None
+
+    async def connect(self):
+        self._websocket = await websockets.connect(self.websocket_url, max_size=None)
+        self._reader_task = asyncio.ensure_future(self._read_messages())
+
+    async def close(self):
+        if self._websocket is not None:
+            await self._websocket.close()
+        if self._reader_task is not None:
+            await self._reader_task
+
+    async def send(self, method, params=None, session_id=None):
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id is not None:
+            message["sessionId"] = session_id
+        await self._websocket.send(json.dumps(message))
+        return await future
+
+    def subscribe(self, method, session_id=None):
+        """
+        Returns a queue receiving the params of every `method` event (of the given session only, if any).
+        """
+        queue = asyncio.Queue()
+        self._listeners.append((method, session_id, queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        self._listeners = [listener for listener in self._listeners if listener[2] is not queue]
+
+    async def attach(self, target_id):
+        # Selenium's window handles are the CDP target ids, every target is attached only once
+        if target_id not in self._sessions:
+            self._sessions[target_id] = asyncio.ensure_future(self._attach(target_id))
+        return await self._sessions[target_id]
+
+    async def _attach(self, target_id):
+        result = await self.send("Target.attachToTarget", {"targetId": target_id, "flatten": True})
+        session_id = result["sessionId"]
+        self._targets[session_id] = target_id
+        await asyncio.gather(self.send("Page.enable", session_id=session_id),
+                             self.send("Page.setLifecycleEventsEnabled", {"enabled": True}, session_id=session_id))
+        return session_id
+
+    async def wait_for_lifecycle(self, target_id, name, timeout):
+        """
+        Waits for a lifecycle event (load, networkAlmostIdle, networkIdle...) of the page currently
+        loaded in the target's main frame. Returns False on timeout, or right away when the document is
+        the one of the previous wait: an in-page navigation keeps the document, whose events say nothing
+        about the new page.
+        """
+        session_id = await self.attach(target_id)
+        document = self._documents.get(session_id, 0)
+        if self._waited_documents.get(session_id) == document:
+            return False
+        queue = self.subscribe("Page.lifecycleEvent", session_id)
+
+        async def wait():
+            while name not in self._lifecycle.get(session_id, ()):
+                await queue.get()
+
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            self._waited_documents[session_id] = self._documents.get(session_id, 0)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.unsubscribe(queue)
+
+    async def block_requests(self, target_id, block=(), allow=(), resource_types=()):
+        """
+        Fails the target's requests matching a block pattern (Chrome wildcards) or of a blocked resource type
+        (Image, Font, Media...), unless they match an allow pattern. Only the requests to block are paused
+        by Chrome, the others never reach us.
+        """
+        session_id = await self.attach(target_id)
+        rules = (tuple(block), tuple(allow), tuple(resource_types))
+        if self._request_rules.get(session_id) == rules:
+            return
+        self._request_rules[session_id] = rules
+        patterns = [{"urlPattern": pattern, "requestStage": "Request"} for pattern in block]
+        patterns += [{"urlPattern": "*", "resourceType": resource_type, "requestStage": "Request"}
+                     for resource_type in resource_types]
+        if patterns:
+            await self.send("Fetch.enable", {"patterns": patterns}, session_id)
+        else:
+            await self.send("Fetch.disable", session_id=session_id)
+
+    async def _resolve_paused_request(self, session_id, params):
+        block, allow, resource_types = self._request_rules.get(session_id, ((), (), ()))
+        url = params["request"]["url"]
+        try:
+            if any(fnmatch.fnmatchcase(url, pattern) for pattern in allow):
+                await self.send("Fetch.continueRequest", {"requestId": params["requestId"]}, session_id)
+            else:
+                await self.send("Fetch.failRequest",
+                                {"requestId": params["requestId"], "errorReason": "BlockedByClient"}, session_id)
+        except CdpError:
+            # The tab was closed or navigated away in the meantime
+            pass
+
+    async def read_stream(self, handle, output_file, session_id=None, chunk_size=512 * 1024):
+        """
+        Writes a DevTools stream (IO.read chunks) to output_file, only one chunk is held in memory.
+        """
+        with open(output_file, 'wb') as f:
+            while True:
+                chunk = await self.send("IO.read", {"handle": handle, "size": chunk_size}, session_id)
+                data = chunk.get("data", "")
+                f.write(base64.b64decode(data) if chunk.get("base64Encoded") else data.encode())
+                if chunk.get("eof"):
+                    break
+        await self.send("IO.close", {"handle": handle}, session_id)
+
+    async def _read_messages(self):
+        try:
+            async for raw_message in self._websocket:
+                message = json.loads(raw_message)
+                if "id" in message:
+                    future = self._pending.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CdpError(message["error"].get("message")))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    self._dispatch(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("The DevTools connection has been closed."))
+            self._pending.clear()
+
+    def _dispatch(self, message):
+        method = message.get("method")
+        session_id = message.get("sessionId")
+        params = message.get("params", {})
+
+        # The main frame of a page target has the target's id, events of ads iframes are ignored
+        if method == "Page.lifecycleEvent" and params.get("frameId") == self._targets.get(session_id):
+            names = self._lifecycle.setdefault(session_id, set())
+            if params.get("name") == "init":
+                names.clear()
+                self._documents[session_id] = self._documents.get(session_id, 0) + 1
+            names.add(params.get("name"))
+        elif method == "Fetch.requestPaused":
+            asyncio.ensure_future(self._resolve_paused_request(session_id, params))
+        elif method == "Target.detachedFromTarget":
+            target_id = self._targets.pop(params.get("sessionId"), None)
+            self._sessions.pop(target_id, None)
+            self._lifecycle.pop(params.get("sessionId"), None)
+            self._documents.pop(params.get("sessionId"), None)
+            self._waited_documents.pop(params.get("sessionId"), None)
+            self._request_rules.pop(params.get("sessionId"), None)
+
+        for wanted_method, wanted_session_id, queue in self._listeners:
+            if wanted_method == method and wanted_session_id in (None, session_id):
+                queue.put_nowait(params)
+
+
+class BrowserCdp:
+    """
+    Runs a CdpClient for one browser on its own event loop thread, for the synchronous capture code.
+    """
+
+    def __init__(self, driver):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+        # Same limit as selenium's own commands, a hung renderer must not block its paper forever
+        self.timeout = config.getint('capture', 'devtools_timeout', fallback=120)
+
+        debugger_address = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+        with urllib.request.urlopen(f"http://{debugger_address}/json/version", timeout=10) as response:
+            websocket_url = json.load(response)["webSocketDebuggerUrl"]
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="cdp", daemon=True)
+        self._thread.start()
+        self.client = CdpClient(websocket_url)
+        self.run(self.client.connect())
+
+    def run(self, coroutine, timeout=None):
+        timeout = timeout or self.timeout
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise CdpError(f"No answer from DevTools after {timeout} seconds.")
+
+    def send(self, method, params=None, target_id=None):
+        async def send():
+            session_id = await self.client.attach(target_id) if target_id else None
+            return await self.client.send(method, params, session_id)
+
+        return self.run(send())
+
+    def print_to_pdf(self, target_id, print_options, output_file, chunk_size=512 * 1024):
+        async def print_to_pdf():
+            session_id = await self.client.attach(target_id)
+            params = dict(print_options, transferMode="ReturnAsStream")
+            result = await self.client.send("Page.printToPDF", params, session_id)
+            await self.client.read_stream(result["stream"], f"{output_file}.part", session_id, chunk_size)
+
+        self.run(print_to_pdf())
+        # Written next to the target first, so an interrupted capture never leaves a truncated page behind
+        os.replace(f"{output_file}.part", output_file)
+
+    def block_requests(self, target_id, block=(), allow=(), resource_types=()):
+        self.run(self.client.block_requests(target_id, block, allow, resource_types))
+
+    def wait_for_network_idle(self, target_id, timeout):
+        # "Almost idle" (2 connections at most for 500 ms) as ads and trackers keep some connections open
+        return self.run(self.client.wait_for_lifecycle(target_id, "networkAlmostIdle", timeout), timeout + 10)
+
+    def close(self):
+        try:
+            self.run(self.client.close(), timeout=5)
+        except Exception as err:
+            print(f"Error while closing the DevTools connection: {err}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_browser_cdps = {}
+_browser_cdps_lock = threading.Lock()
+
+
+def get_browser_cdp(driver):
+    # One DevTools connection per browser, shared by everything using the driver
+    with _browser_cdps_lock:
+        if driver.session_id not in _browser_cdps:
+            _browser_cdps[driver.session_id] = BrowserCdp(driver)
+        return _browser_cdps[driver.session_id]
+
+
+def close_browser_cdp(driver):
+    with _browser_cdps_lock:
+        browser_cdp = _browser_cdps.pop(driver.session_id, None)
+    if browser_cdp is not None:
+        browser_cdp.close()
@@ -9,4 +9,7 @@ VAARTHA = "VaarthaPaper"
 ANDHARAJOTHI = "AndhraJyothi"
 ANDHRA_PRABHA="Andhra Prabha"
 SAKSHI = "Sakshi"
+SURYA_MAIN = "SuryaMain"
+SURYA_DT = "SuryaDistrict"
+VAARTHA_MAIN = "Vaartha"
 EENADU = "Eenadu"
@@ -0,0 +1,148 @@
+import configparser
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urljoin
+
+from CaptureCache import CaptureCache
+from HttpDownloader import get_http_session
+from Metrics import file_size, file_stem, metrics
+from PDFGenerator import write_to_a_file
+from PdfUtils import jpeg_to_pdf
+from RateLimiter import rate_limiter
+from RetryPolicy import latency_history, retry_policy
+
+PDF_LINK_PATTERN = re.compile(r"""(?:href|src|data-src)\s*=\s*["']([^"']+\.pdf(?:\?[^"']*)?)["']""", re.IGNORECASE)
+OG_IMAGE_PATTERN = re.compile(r"""<meta[^>]+property=["']og:image["'][^>]+content=["']([^"']+)["']""", re.IGNORECASE)
+PAGE_NUMBER_PATTERN = re.compile(r"[?&](?:amp;)?pg_no=(\d+)", re.IGNORECASE)
+PAGE_IMAGE_PATTERN = re.compile(r"""<img[^>]+?(?:data-src|src)\s*=\s*["']([^"']+\.jpe?g(?:\?[^"']*)?)["']""",
+                                re.IGNORECASE)
+
+
+def find_page_assets(html, page_url):
+    """
+    Returns the URLs of the PDFs and page images behind an e-paper page view, the ones of the page itself
+    first and its share image (og:image) last.
+    """
+    asset_urls = []
+    for pattern in (PDF_LINK_PATTERN, PAGE_IMAGE_PATTERN, OG_IMAGE_PATTERN):
+        for match in pattern.finditer(html):
+            asset_url = urljoin(page_url, match.group(1).replace("&amp;", "&"))
+            if asset_url not in asset_urls:
+                asset_urls.append(asset_url)
+    return asset_urls
+
+
+class PrajasaktiFetcher:
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        # Used when the page list of the edition can't be read
+        self.pages = config.getint('prajasakthi', 'pages', fallback=8)
+        self.workers = config.getint('prajasakthi', 'fetch_workers', fallback=8)
+        self.timeout = config.getint('prajasakthi', 'fetch_timeout', fallback=30)
+        self.session = get_http_session(self.workers)
+        self.capture_cache = CaptureCache()
+
+    def discover_page_numbers(self, first_page_url):
+        """
+        Reads the highest page number linked from the first page of the edition, so supplements are not
+        missed. The first page may only link to its neighbours, so every page up to that one is read and
+        never fewer than the configured pages.
+        """
+        try:
+            with rate_limiter.request(first_page_url):
+                response = self.session.get(first_page_url, timeout=self.timeout)
+            response.raise_for_status()
+            last_page = max((int(page_no) for page_no in PAGE_NUMBER_PATTERN.findall(response.text)), default=0)
+        except Exception as err:
+            print(f"Couldn't read the page list of {first_page_url}: {err}")
+            last_page = 0
+        page_numbers = list(range(1, max(last_page, self.pages) + 1))
+        print(f"Found {len(page_numbers)} pages in {first_page_url}.")
+        return page_numbers
+
+    def read_page_assets(self, page_url, timeout=None):
+        timeout = timeout or self.timeout
+        with rate_limiter.request(page_url):
+            response = self.session.get(page_url, timeout=timeout)
+        response.raise_for_status()
+        return find_page_assets(response.text, page_url)
+
+    def fetch_asset(self, asset_url, target, timeout=None):
+        timeout = timeout or self.timeout
+        with rate_limiter.request(asset_url):
+            asset = self.session.get(asset_url, timeout=timeout)
+        asset.raise_for_status()
+        if asset.content.startswith(b"%PDF"):
+            write_to_a_file(asset.content, target)
+        elif asset.content.startswith(b"\xff\xd8"):
+            jpeg_to_pdf(asset.content, target)
+        else:
+            return False
+        # A logo or a blank image is left to the browser
+        if not self.capture_cache.is_valid(target):
+            os.remove(target)
+            return False
+        return True
+
+    def _try_read_page_assets(self, page_url, target):
+        paper_name = os.path.basename(os.path.dirname(target))
+
+        def read():
+            with metrics.stage("resolve", paper=paper_name, page=file_stem(target)):
+                return self.read_page_assets(page_url, latency_history.timeout("fetch", self.timeout, paper_name))
+
+        try:
+            return retry_policy.call(read, f"Read of {page_url}", page=file_stem(target))
+        except Exception as err:
+            print(f"Couldn't read {page_url} directly: {err}")
+            return []
+
+    def _try_fetch_page(self, page_url, target, asset_url, on_fetched=None):
+        # Pages are cached as <paper>/<page no>.pdf
+        paper_name = os.path.basename(os.path.dirname(target))
+        if asset_url is None:
+            print(f"Couldn't find the page of {page_url}, it is left to the browser.")
+            return False
+
+        def fetch():
+            with metrics.stage("fetch", paper=paper_name, page=file_stem(target)) as record:
+                timeout = latency_history.timeout("fetch", self.timeout, paper_name)
+                started = time.perf_counter()
+                fetched = self.fetch_asset(asset_url, target, timeout)
+                latency_history.record("fetch", time.perf_counter() - started, paper_name)
+                record["bytes"] = file_size(target) if fetched else 0
+            return fetched
+
+        try:
+            fetched = retry_policy.call(fetch, f"Fetch of {asset_url}", page=file_stem(target))
+        except Exception as err:
+            print(f"Couldn't fetch {asset_url} directly: {err}")
+            return False
+        if fetched and on_fetched is not None:
+            on_fetched(target)
+        return fetched
+
+    def fetch_pages(self, pages, on_fetched=None):
+        """
+        Downloads all the {page url: target file} pages at once without a browser, on_fetched(target)
+        is called as soon as each page is on disk.
+        Every page takes its first asset no other page links to: the site logo, share image or full
+        edition PDF found on every page view is nobody's page.
+        Returns the pages which couldn't be resolved, so that they can be rendered by the browser.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prajasakti") as executor:
+            page_assets = list(executor.map(self._try_read_page_assets, pages, pages.values()))
+            links = Counter(asset_url for asset_urls in page_assets for asset_url in asset_urls)
+            asset_urls = [next((asset_url for asset_url in asset_urls if links[asset_url] == 1 or len(pages) == 1),
+                               None) for asset_urls in page_assets]
+            results = executor.map(partial(self._try_fetch_page, on_fetched=on_fetched), pages, pages.values(),
+                                   asset_urls)
+            fetched = dict(zip(pages, results))
+        return {page_url: target for page_url, target in pages.items() if not fetched[page_url]}
@@ -0,0 +1,171 @@
+import configparser
+import queue
+import threading
+
+from BrowserProfiles import BrowserProfiles
+from CdpClient import close_browser_cdp
+from Metrics import metrics
+from PDFGenerator import get_chrome_driver
+
+
+def is_driver_healthy(driver):
+    try:
+        # A dead session or a crashed renderer ("tab crashed") both raise here
+        driver.current_window_handle
+        return driver.execute_script("return 1;") == 1
+    except Exception:
+        return False
+
+
+def reset_driver(driver, keep_storage=False):
+    # Keep only the first tab
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+
+    # Storage is per origin, so it has to be cleared before leaving the current page.
+    # A persistent profile keeps it, consents are stored in cookies or local storage
+    if not keep_storage:
+        try:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        except Exception:
+            pass
+        driver.delete_all_cookies()
+    driver.get("about:blank")
+
+
+def quit_driver(driver):
+    try:
+        close_browser_cdp(driver)
+        driver.quit()
+    except Exception as err:
+        print(f"Error while closing the driver: {err}")
+
+
+class DriverPool:
+
+    def __init__(self, size=None, max_pages=None):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.size = size or config.getint('driver_pool', 'size', fallback=3)
+        # A session is recycled after rendering this many pages to cap Chrome's memory growth
+        self.max_pages = max_pages or config.getint('driver_pool', 'max_pages', fallback=60)
+        # Browsers are pre-started in the background, so that browserless papers start right away
+        self.background_warm_up = config.getboolean('driver_pool', 'background_warm_up', fallback=True)
+        self.profiles = BrowserProfiles()
+
+        self._idle = queue.LifoQueue()
+        self._page_counts = {}
+        self._profile_directories = {}
+        self._sessions = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._warm_up_threads = []
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._sessions < self.size:
+                self._sessions += 1
+                return True
+            return False
+
+    def _create_driver(self):
+        profile_directory = self.profiles.acquire()
+        try:
+            with metrics.stage("chrome_startup"):
+                driver = get_chrome_driver(profile_directory, self.profiles.disk_cache_mb)
+        except Exception:
+            self.profiles.release(profile_directory)
+            with self._lock:
+                self._sessions -= 1
+            raise
+        with self._lock:
+            self._page_counts[driver] = 0
+            self._profile_directories[driver] = profile_directory
+        return driver
+
+    def _discard_driver(self, driver):
+        with self._lock:
+            self._page_counts.pop(driver, None)
+            profile_directory = self._profile_directories.pop(driver, None)
+            self._sessions -= 1
+        quit_driver(driver)
+        self.profiles.release(profile_directory)
+
+    def warm_up(self):
+        """
+        Pre-starts the sessions so that Chrome start up is not paid by the first papers.
+        The browsers are started at the same time, papers needing one take the first which is ready.
+        """
+        while self._reserve_slot():
+            thread = threading.Thread(target=self._warm_up_session, name="warm-up", daemon=True)
+            thread.start()
+            self._warm_up_threads.append(thread)
+        if not self.background_warm_up:
+            self._join_warm_up()
+            print(f"Driver pool is ready with {self._sessions} sessions.")
+
+    def _warm_up_session(self):
+        try:
+            driver = self._create_driver()
+        except Exception as err:
+            # Not fatal, browserless papers still run and the others start their session on first use
+            print(f"Couldn't pre-start a browser session: {err}")
+            return
+        if self._closed:
+            self._discard_driver(driver)
+        else:
+            self._idle.put(driver)
+
+    def _join_warm_up(self):
+        for thread in self._warm_up_threads:
+            thread.join()
+        self._warm_up_threads = []
+
+    def acquire(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve_slot():
+                    return self._create_driver()
+                try:
+                    # Wait for a session to be released, or for a slot to be freed by a recycled one
+                    driver = self._idle.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+            if is_driver_healthy(driver):
+                return driver
+            print("Found a dead browser session, replacing it.")
+            self._discard_driver(driver)
+
+    def release(self, driver, pages=0):
+        with self._lock:
+            page_count = self._page_counts.get(driver, 0) + pages
+            self._page_counts[driver] = page_count
+
+        if self._closed or page_count >= self.max_pages or not is_driver_healthy(driver):
+            self._discard_driver(driver)
+            return
+
+        try:
+            reset_driver(driver, keep_storage=self.profiles.enabled)
+            self._idle.put(driver)
+        except Exception as err:
+            print(f"Error while resetting the driver: {err}")
+            self._discard_driver(driver)
+
+    def close(self):
+        self._closed = True
+        # Browsers still starting are quit as soon as they are up
+        self._join_warm_up()
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard_driver(driver)
@@ -3,41 +3,93 @@ Created by Samba Chennamsetty on 6/14/2023.
 """
 
 import configparser
+import hashlib
+import json
 import os
-from datetime import date, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
-import dropbox
+from EditionDates import previous_edition_folder
+from LazyImport import LazyModule
+from Metrics import file_stem, metrics
 
+# Only imported once the first Dropbox call is made, by then the scraping has started
+dropbox = LazyModule("dropbox")
 
-def remove_folder():
-    today_date = date.today() + timedelta(days=1)
-    today_date_str = today_date.strftime("%Y-%m-%d")
 
+def remove_folder(folder_path):
     # Delete the local folder
-    if os.path.exists(today_date_str):
+    if os.path.exists(folder_path):
         try:
-            os.rmdir(today_date_str)
+            os.rmdir(folder_path)
         except OSError as e:
-            print(f"Error while removing a folder: {today_date_str}: {e}")
+            print(f"Error while removing a folder: {folder_path}: {e}")
     else:
-        print(f"The folder {today_date_str} doesn't exists.")
+        print(f"The folder {folder_path} doesn't exists.")
+
+
+def dropbox_content_hash(local_file_path):
+    # Dropbox's content hash: sha256 of the concatenated sha256 digests of every 4 MB block
+    block_hashes = hashlib.sha256()
+    with open(local_file_path, 'rb') as f:
+        while True:
+            block = f.read(4 * 1024 * 1024)
+            if not block:
+                break
+            block_hashes.update(hashlib.sha256(block).digest())
+    return block_hashes.hexdigest()
+
+
+def load_json_file(file_path):
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def save_json_file(file_path, data):
+    with open(file_path, 'w') as f:
+        json.dump(data, f, indent=2)
 
 
 class DropboxManager:
 
-    def __init__(self):
+    def __init__(self, dbx=None):
         config = configparser.ConfigParser()
         config.read('config.properties')
 
+        # Files are streamed from disk in chunks of this size through upload sessions
+        self.chunk_size = config.getint('dropbox', 'chunk.size.mb', fallback=8) * 1024 * 1024
+        # Session cursors are persisted here so that an interrupted upload resumes where it stopped
+        self.sessions_file = config.get('dropbox', 'upload.sessions.file', fallback='upload_sessions.json')
+        self._sessions_lock = threading.Lock()
+        # Content hashes of the uploaded papers by date/paper, to skip uploading them again on a re-run
+        self.manifest_file = config.get('dropbox', 'upload.manifest.file', fallback='upload_manifest.json')
+        self._manifest_lock = threading.Lock()
+
+        # A client can be handed in, e.g. one talking to a local fake Dropbox
+        self._dbx = dbx
+        self._dbx_lock = threading.Lock()
         # Get the access token from config file by section and key
-        access_token = config['dropbox']['access.token']
-        self.dbx = dropbox.Dropbox(access_token)
+        self.access_token = config['dropbox']['access.token'] if dbx is None else None
+
+    @property
+    def dbx(self):
+        # The client (and the SDK) is created on first use, from the background workers
+        with self._dbx_lock:
+            if self._dbx is None:
+                self._dbx = dropbox.Dropbox(self.access_token)
+        return self._dbx
 
-    def create_folder(self, folder_path):
+    def create_folder(self, folder_path, remove_previous=True):
         try:
 
             # removes dropbox yesterday folder
-            self._remove_dropbox_folder()
+            if remove_previous:
+                self._remove_dropbox_folder(previous_edition_folder(folder_path))
 
             # create local folder
             os.makedirs(f'{folder_path}', exist_ok=True)
@@ -51,31 +103,220 @@ class DropboxManager:
             else:
                 print(f"Error while creating a folder: {folder_path}: {e}")
 
-    def _remove_dropbox_folder(self):
-        today_date = date.today()
-        today_date_str = today_date.strftime("%Y-%m-%d")
-
+    def _remove_dropbox_folder(self, folder_path):
         try:
-            metadata = self.dbx.files_get_metadata(f"/{today_date_str}")
+            metadata = self.dbx.files_get_metadata(f"/{folder_path}")
         except dropbox.exceptions.ApiError as e:
-            print(f"Folder doesn't exists: {today_date_str}")
+            print(f"Folder doesn't exists: {folder_path}")
+            self._forget_folder(folder_path)
             return
 
         # Delete the dropbox folder
-        self.dbx.files_delete_v2(f"/{today_date_str}")
-        print(f"The folder {today_date_str} has been successfully deleted.")
+        self.dbx.files_delete_v2(f"/{folder_path}")
+        self._forget_folder(folder_path)
+        print(f"The folder {folder_path} has been successfully deleted.")
 
-    def upload_files(self, folder_path):
+    def upload_file(self, local_file_path, folder_path):
+        # Uploads and commits a single paper, papers running in parallel never touch each other's files
+        self.finish_uploads([self.start_upload(local_file_path, folder_path)])
+
+    def start_upload(self, local_file_path, folder_path):
+        """
+        Streams the file through its own upload session, everything but the commit.
+        Returns the (finish arg, file, content hash) finish_uploads commits, or None when there is nothing to commit.
+        """
+        if not os.path.exists(local_file_path):
+            print(f"The file {local_file_path} doesn't exists.")
+            return None
         try:
-            for root, dirs, files in os.walk(folder_path):
-                for filename in files:
-                    if filename.lower().endswith('.pdf'):  # Filter for PDF files
-                        local_file_path = os.path.join(root, filename)
-                        print(f"Uploading {local_file_path} file")
-                        dropbox_file_path = os.path.join(f'/{folder_path}', filename).replace("\\", "/")
-                        with open(local_file_path, 'rb') as f:
-                            self.dbx.files_upload(f.read(), dropbox_file_path, mode=dropbox.files.WriteMode.overwrite)
-                        os.remove(local_file_path)
+            filename = os.path.basename(local_file_path)
+            dropbox_file_path = os.path.join(f'/{folder_path}', filename).replace("\\", "/")
+            content_hash = dropbox_content_hash(local_file_path)
+            if self._is_already_uploaded(local_file_path, dropbox_file_path, content_hash):
+                print(f"{local_file_path} is unchanged, skipping the upload")
+                os.remove(local_file_path)
+                return None
 
+            print(f"Uploading {local_file_path} file")
+            with metrics.stage("upload", paper=file_stem(local_file_path)) as record:
+                cursor = self._upload_session(local_file_path, record)
+            commit = dropbox.files.CommitInfo(path=dropbox_file_path, mode=dropbox.files.WriteMode.overwrite)
+            return dropbox.files.UploadSessionFinishArg(cursor=cursor, commit=commit), local_file_path, content_hash
         except dropbox.exceptions.ApiError as e:
             print(f"Exception while uploading a file to Dropbox: {e}")
+            return None
+
+    def finish_uploads(self, uploads):
+        """
+        Commits all the files streamed by start_upload with one finish batch call.
+        """
+        uploads = [upload for upload in uploads if upload is not None]
+        if not uploads:
+            return
+
+        try:
+            with metrics.stage("upload_commit"):
+                result = self.dbx.files_upload_session_finish_batch_v2([entry for entry, _, _ in uploads])
+        except dropbox.exceptions.ApiError as e:
+            print(f"Exception while uploading a file to Dropbox: {e}")
+            return
+
+        for (_, local_file_path, content_hash), entry in zip(uploads, result.entries):
+            if entry.is_success():
+                self._save_session(local_file_path, None)
+                self._save_manifest(local_file_path, content_hash)
+                os.remove(local_file_path)
+            else:
+                # The session can't be committed again, the next attempt starts a new one
+                self._save_session(local_file_path, None)
+                print(f"Exception while uploading a file to Dropbox: {local_file_path}: {entry.get_failure()}")
+
+    def _upload_session(self, local_file_path, record=None):
+        # record: metrics record counting the bytes sent and the retries
+        record = record if record is not None else {"bytes": 0, "retries": 0}
+        file_size = os.path.getsize(local_file_path)
+        file_mtime = os.path.getmtime(local_file_path)
+
+        state = self._load_sessions().get(local_file_path)
+        if state and (state['size'], state['mtime']) != (file_size, file_mtime):
+            # The file has changed since the interrupted upload
+            state = None
+
+        with open(local_file_path, 'rb') as f:
+            if state is None:
+                data = f.read(self.chunk_size)
+                closed = len(data) >= file_size
+                session = self.dbx.files_upload_session_start(data, close=closed)
+                record["bytes"] += len(data)
+                state = {'session_id': session.session_id, 'offset': len(data), 'size': file_size,
+                         'mtime': file_mtime, 'closed': closed}
+                self._save_session(local_file_path, state)
+            else:
+                print(f"Resuming the upload of {local_file_path} at {state['offset']} bytes")
+
+            while not state['closed']:
+                f.seek(state['offset'])
+                data = f.read(self.chunk_size)
+                closed = state['offset'] + len(data) >= file_size
+                cursor = dropbox.files.UploadSessionCursor(session_id=state['session_id'], offset=state['offset'])
+                try:
+                    self.dbx.files_upload_session_append_v2(data, cursor, close=closed)
+                except dropbox.exceptions.ApiError as e:
+                    if e.error.is_incorrect_offset():
+                        # Dropbox already has more (or less) than we persisted, continue from its offset
+                        state['offset'] = e.error.get_incorrect_offset().correct_offset
+                        record["retries"] += 1
+                        self._save_session(local_file_path, state)
+                        continue
+                    if e.error.is_not_found():
+                        # The session has expired, start over
+                        self._save_session(local_file_path, None)
+                        record["retries"] += 1
+                        return self._upload_session(local_file_path, record)
+                    raise
+                state['offset'] += len(data)
+                state['closed'] = closed
+                record["bytes"] += len(data)
+                self._save_session(local_file_path, state)
+
+        return dropbox.files.UploadSessionCursor(session_id=state['session_id'], offset=file_size)
+
+    def is_uploaded(self, local_file_path):
+        # Recorded once Dropbox has committed the file
+        return local_file_path in load_json_file(self.manifest_file)
+
+    def _is_already_uploaded(self, local_file_path, dropbox_file_path, content_hash):
+        # Only papers recorded with the same hash are checked against Dropbox, the others are uploaded right away
+        if load_json_file(self.manifest_file).get(local_file_path) != content_hash:
+            return False
+        try:
+            metadata = self.dbx.files_get_metadata(dropbox_file_path)
+        except dropbox.exceptions.ApiError:
+            return False
+        return getattr(metadata, 'content_hash', None) == content_hash
+
+    def _save_manifest(self, local_file_path, content_hash):
+        with self._manifest_lock:
+            manifest = load_json_file(self.manifest_file)
+            manifest[local_file_path] = content_hash
+            save_json_file(self.manifest_file, manifest)
+
+    def _forget_folder(self, folder_path):
+        # The papers of a deleted folder are no longer in Dropbox, a backfill of its date must upload them again
+        with self._manifest_lock:
+            manifest = load_json_file(self.manifest_file)
+            kept = {path: content_hash for path, content_hash in manifest.items()
+                    if not path.startswith(f"{folder_path}/")}
+            if len(kept) != len(manifest):
+                save_json_file(self.manifest_file, kept)
+
+    def _load_sessions(self):
+        return load_json_file(self.sessions_file)
+
+    def _save_session(self, local_file_path, state):
+        with self._sessions_lock:
+            sessions = self._load_sessions()
+            if state is None:
+                sessions.pop(local_file_path, None)
+            else:
+                sessions[local_file_path] = state
+            save_json_file(self.sessions_file, sessions)
+
+
+class UploadQueue:
+    """
+    Uploads the finished papers in the background so that the downloads never wait for Dropbox.
+    Each paper is streamed through its upload session as soon as it is submitted, all of them are
+    committed together with one finish batch call once the queue has drained.
+    """
+
+    def __init__(self, dropbox_manager, max_workers=None):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.dropbox_manager = dropbox_manager
+        self.max_workers = max_workers or config.getint('dropbox', 'upload.workers', fallback=2)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upload")
+        self._futures = {}
+        self._uploads = []
+        self._lock = threading.Lock()
+
+    def create_folder(self, folder_path, remove_previous=True):
+        # Removing yesterday's folder and creating today's are Dropbox calls only, the scraping doesn't wait for them
+        future = self._executor.submit(self._create_folder, folder_path, remove_previous)
+        with self._lock:
+            self._futures[future] = folder_path
+
+    def _create_folder(self, folder_path, remove_previous):
+        with metrics.stage("dropbox_setup"):
+            self.dropbox_manager.create_folder(folder_path, remove_previous)
+
+    def submit(self, local_file_path, folder_path):
+        future = self._executor.submit(self._upload, local_file_path, folder_path)
+        with self._lock:
+            self._futures[future] = local_file_path
+
+    def _upload(self, local_file_path, folder_path):
+        with metrics.paper(file_stem(local_file_path)):
+            upload = self.dropbox_manager.start_upload(local_file_path, folder_path)
+        if upload is not None:
+            with self._lock:
+                self._uploads.append(upload)
+
+    def join(self):
+        # Waits for the queue to drain, including uploads submitted while waiting
+        while True:
+            with self._lock:
+                pending = [future for future in self._futures if not future.done()]
+            if not pending:
+                break
+            wait(pending)
+
+        with self._lock:
+            for future, local_file_path in self._futures.items():
+                if future.exception() is not None:
+                    print(f"Exception while uploading {local_file_path} to Dropbox: {future.exception()}")
+            self._futures.clear()
+            uploads, self._uploads = self._uploads, []
+        self.dropbox_manager.finish_uploads(uploads)
+        self._executor.shutdown(wait=True)
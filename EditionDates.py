@@ -0,0 +1,33 @@
+from datetime import date, datetime, timedelta
+
+# Editions are stored by date, locally and in Dropbox
+FOLDER_DATE_FORMAT = "%Y-%m-%d"
+
+
+def next_edition_date():
+    # The papers are downloaded the evening before, for tomorrow's edition
+    return date.today() + timedelta(days=1)
+
+
+def edition_folder(edition_date):
+    return edition_date.strftime(FOLDER_DATE_FORMAT)
+
+
+def parse_edition_date(text):
+    return datetime.strptime(text, FOLDER_DATE_FORMAT).date()
+
+
+def previous_edition_folder(folder_path):
+    return edition_folder(parse_edition_date(folder_path) - timedelta(days=1))
+
+
+def edition_dates(start, end, max_days=31):
+    """
+    Returns the dates from start to end included, at most max_days of them.
+    """
+    days = (end - start).days + 1
+    if days < 1:
+        raise ValueError(f"{start} is after {end}.")
+    if days > max_days:
+        raise ValueError(f"{days} days from {start} to {end}, at most {max_days} can be downloaded at once.")
+    return [start + timedelta(days=day) for day in range(days)]
@@ -0,0 +1,101 @@
+import configparser
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from Metrics import file_size, file_stem, metrics
+from RateLimiter import rate_limiter
+from RetryPolicy import retry_policy
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+
+# Overloaded or throttled servers, worth asking again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def get_http_session(pool_size=10, retries=3, backoff=1.0):
+    # Keep-alive connections shared by all the downloads, failed requests are retried with backoff
+    # unless the caller retries them itself (retries=0)
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=("GET", "HEAD")) if retries else 0
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+
+class HttpDownloader:
+    """
+    Streams files to disk with a pooled session. An interrupted download is resumed with a Range
+    request from what is already in the .part file instead of starting over.
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.workers = config.getint('http', 'workers', fallback=4)
+        self.timeout = config.getint('http', 'timeout', fallback=30)
+        self.retries = config.getint('http', 'retries', fallback=3)
+        self.chunk_size = config.getint('http', 'chunk_kb', fallback=256) * 1024
+        # The downloads are retried here, resuming from the .part file, not by the session as well
+        self.session = get_http_session(self.workers, retries=0)
+
+    def download(self, url, filename):
+        part_file = f"{filename}.part"
+        with metrics.stage("download", paper=file_stem(filename)) as record:
+            for attempt in range(self.retries + 1):
+                record["retries"] = attempt
+                try:
+                    self._download_part(url, part_file)
+                    os.replace(part_file, filename)
+                    record["bytes"] = file_size(filename)
+                    print(f"{filename} downloaded successfully.")
+                    return True
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as err:
+                    print(f"Download of {filename} interrupted: {err}")
+                    time.sleep(retry_policy.delay(attempt))
+                except requests.HTTPError as err:
+                    if err.response is not None and err.response.status_code in RETRY_STATUSES:
+                        print(f"Download of {filename} refused for now: {err}")
+                        time.sleep(retry_policy.delay(attempt))
+                        continue
+                    print(f"Failed to download {filename}: {err}")
+                    record["error"] = str(err)
+                    return False
+                except (requests.RequestException, OSError) as err:
+                    print(f"Failed to download {filename}: {err}")
+                    record["error"] = str(err)
+                    return False
+            print(f"Failed to download {filename}.")
+            record["error"] = "Too many retries"
+            return False
+
+    def _download_part(self, url, part_file):
+        downloaded = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        headers = {"Range": f"bytes={downloaded}-"} if downloaded else {}
+        with rate_limiter.request(url):
+            with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 416:
+                    # The .part file already holds the whole file
+                    return
+                response.raise_for_status()
+                # A server ignoring the Range header sends the whole file again
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                with open(part_file, mode) as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+
+    def download_all(self, files):
+        """
+        Downloads all the {url: filename} files at the same time, returns {filename: downloaded}.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as executor:
+            results = executor.map(self.download, files, files.values())
+            return dict(zip(files.values(), results))
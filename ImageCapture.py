@@ -0,0 +1,41 @@
+import configparser
+
+from HttpDownloader import get_http_session
+from PageReadiness import get_page_image_url
+from PdfUtils import image_to_pdf
+from RateLimiter import rate_limiter
+
+
+class ImageCapture:
+    """
+    Captures a page by downloading its original scan and wrapping it into a PDF page, instead of
+    printing it through Chrome's PDF engine which re-encodes and inflates the scan.
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.enabled = config.get('capture', 'mode', fallback='print') == 'image'
+        self.dpi = config.getint('capture', 'image_dpi', fallback=150)
+        # Scans are only re-encoded when a lower resolution is asked for
+        self.downsample_dpi = config.getint('capture', 'downsample_dpi', fallback=0) or None
+        self.jpeg_quality = config.getint('capture', 'jpeg_quality', fallback=85)
+        self.timeout = config.getint('capture', 'image_timeout', fallback=30)
+        self.session = get_http_session()
+
+    def capture(self, driver, target):
+        """
+        Returns False when the page scan can't be found or converted, the page is then printed instead.
+        """
+        image_url = get_page_image_url(driver)
+        if not image_url or not image_url.startswith("http"):
+            return False
+
+        # The scan is requested like the browser did, with its cookies and the page as referer
+        cookies = {cookie['name']: cookie['value'] for cookie in driver.get_cookies()}
+        with rate_limiter.request(image_url):
+            response = self.session.get(image_url, cookies=cookies, headers={"Referer": driver.current_url},
+                                        timeout=self.timeout)
+        response.raise_for_status()
+        return image_to_pdf(response.content, target, self.dpi, self.downsample_dpi, self.jpeg_quality)
@@ -0,0 +1,22 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stands for a module which is only imported when one of its attributes is first used, so that
+    heavy libraries not needed to start scraping (e.g. the Dropbox SDK) don't slow the start up down.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            # Several upload workers can use the module for the first time at once
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
@@ -0,0 +1,132 @@
+import configparser
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def file_stem(file_path):
+    # Papers and pages are named after their files, e.g. 2026-10-19/Sakshi.pdf or capture_cache/.../Sakshi/3.pdf
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def file_size(file_path):
+    return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+
+class RunMetrics:
+    """
+    Records the duration, bytes and retries of every stage of a run (chrome startup, navigation,
+    readiness, print, merge, upload...) by paper and page.
+    The paper is taken from the current thread when it isn't given, see paper().
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.report_file = config.get('metrics', 'report_file', fallback='run_report.json')
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._records = []
+        self.first_page_seconds = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self):
+        # Starts a new run, e.g. between benchmark rounds
+        with self._lock:
+            self.started_at = datetime.now()
+            self._started = time.perf_counter()
+            self._records = []
+            self.first_page_seconds = None
+
+    @contextmanager
+    def paper(self, paper_name):
+        # Stages recorded by this thread belong to paper_name until the block ends
+        previous = getattr(self._local, 'paper', None)
+        self._local.paper = paper_name
+        try:
+            yield
+        finally:
+            self._local.paper = previous
+
+    def current_paper(self):
+        return getattr(self._local, 'paper', None)
+
+    @contextmanager
+    def stage(self, stage, paper=None, page=None):
+        """
+        Times the block as a stage, the block can fill in the yielded record's "bytes" and "retries".
+        """
+        record = {"paper": paper or getattr(self._local, 'paper', None), "page": page, "stage": stage,
+                  "bytes": 0, "retries": 0, "error": None}
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as err:
+            record["error"] = str(err)
+            raise
+        finally:
+            record["seconds"] = round(time.perf_counter() - started, 3)
+            with self._lock:
+                self._records.append(record)
+
+    def page_ready(self):
+        # Time to first page: from the start of the run to the first page added to a paper
+        with self._lock:
+            if self.first_page_seconds is None:
+                self.first_page_seconds = round(time.perf_counter() - self._started, 3)
+
+    def summary(self):
+        """
+        Returns the totals of every stage by paper: {paper: {stage: {count, seconds, bytes, retries, errors}}}.
+        """
+        papers = {}
+        with self._lock:
+            records = list(self._records)
+        for record in records:
+            totals = papers.setdefault(record["paper"] or "run", {}).setdefault(
+                record["stage"], {"count": 0, "seconds": 0.0, "bytes": 0, "retries": 0, "errors": 0})
+            totals["count"] += 1
+            totals["seconds"] = round(totals["seconds"] + record["seconds"], 3)
+            totals["bytes"] += record["bytes"]
+            totals["retries"] += record["retries"]
+            totals["errors"] += record["error"] is not None
+        return papers
+
+    def report(self):
+        with self._lock:
+            records = list(self._records)
+        return {
+            "started_at": self.started_at.isoformat(timespec='seconds'),
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "time_to_first_page": self.first_page_seconds,
+            "papers": self.summary(),
+            "stages": records,
+        }
+
+    def write_report(self, report_file=None):
+        report_file = report_file or self.report_file
+        try:
+            with open(report_file, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+            print(f"Run report written to {report_file}")
+        except OSError as err:
+            print(f"Error while writing the run report: {report_file}: {err}")
+
+    def print_summary(self):
+        print(f"{'Paper':<20} {'Stage':<16} {'Count':>6} {'Seconds':>9} {'MB':>8} {'Retries':>8} {'Errors':>7}")
+        for paper_name, stages in sorted(self.summary().items()):
+            for stage, totals in stages.items():
+                print(f"{paper_name:<20} {stage:<16} {totals['count']:>6} {totals['seconds']:>9.2f} "
+                      f"{totals['bytes'] / (1024 * 1024):>8.2f} {totals['retries']:>8} {totals['errors']:>7}")
+        if self.first_page_seconds is not None:
+            print(f"First page was ready after {self.first_page_seconds:.2f} seconds.")
+        print(f"Run took {time.perf_counter() - self._started:.2f} seconds.")
+
+
+# One collector for the whole run, shared by every module
+metrics = RunMetrics()
@@ -4,70 +4,128 @@ Created by Samba Chennamsetty on 6/14/2023.
 
 # File: PDFGenerator.py
 
-import base64
+import configparser
 import json
+import os
+import shutil
+import threading
 
 from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.expected_conditions import staleness_of
-from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.chrome.options import Options
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.driver_finder import DriverFinder
 
+from CdpClient import close_browser_cdp, get_browser_cdp
+from Metrics import file_size, file_stem, metrics
+from PageReadiness import wait_for_page_ready
 
-def get_chrome_driver():
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+
+def resolve_chromedriver(options, refresh=False):
+    """
+    Finds chromedriver once and caches its path on disk, instead of letting selenium manager look it up
+    (and check for updates online) every time a browser is started.
+    Order: [driver] chromedriver_path, the cached path, chromedriver on the PATH, selenium manager.
+    With refresh, selenium manager is asked right away.
+    """
+    global _chromedriver_path
+    config = configparser.ConfigParser()
+    config.read('config.properties')
+    configured_path = config.get('driver', 'chromedriver_path', fallback='')
+    cache_file = config.get('driver', 'chromedriver_cache', fallback='chromedriver_cache.json')
+    if configured_path:
+        return configured_path
+
+    with _chromedriver_lock:
+        if refresh:
+            _chromedriver_path = None
+        elif _chromedriver_path is None and os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    _chromedriver_path = json.load(f).get('path')
+            except ValueError:
+                _chromedriver_path = None
+        if _chromedriver_path and os.path.exists(_chromedriver_path):
+            return _chromedriver_path
+
+        # A refresh means the chromedriver found before doesn't fit Chrome, selenium manager fetches one which does
+        _chromedriver_path = None if refresh else shutil.which("chromedriver")
+        if _chromedriver_path is None and hasattr(DriverFinder, 'get_driver_path'):
+            _chromedriver_path = DriverFinder(Service(), options).get_driver_path()
+        elif _chromedriver_path is None:
+            # Selenium before 4.20
+            _chromedriver_path = DriverFinder.get_path(Service(), options)
+        with open(cache_file, 'w') as f:
+            json.dump({'path': _chromedriver_path}, f)
+        return _chromedriver_path
+
+
+def get_chrome_driver(profile_directory=None, disk_cache_mb=None):
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(options=options)
+    # A persistent profile keeps the sites' cached assets and cookies across runs, see BrowserProfiles
+    if profile_directory:
+        options.add_argument(f"--user-data-dir={profile_directory}")
+    if disk_cache_mb:
+        options.add_argument(f"--disk-cache-size={disk_cache_mb * 1024 * 1024}")
+    try:
+        driver = webdriver.Chrome(options=options, service=Service(resolve_chromedriver(options)))
+    except Exception as err:
+        # Chrome may have been updated past the cached chromedriver, look it up again once
+        print(f"Couldn't start Chrome with the cached chromedriver, looking it up again: {err}")
+        driver = webdriver.Chrome(options=options, service=Service(resolve_chromedriver(options, refresh=True)))
     driver.maximize_window()  # Maximize the Chrome browser window
     return driver
 
 
 def write_to_a_file(result_data, target):
-    with open(target, "wb") as file:
+    # Written next to the target first, so an interrupted write never leaves a truncated page behind
+    with open(f"{target}.part", "wb") as file:
         file.write(result_data)
+    os.replace(f"{target}.part", target)
 
 
 class PDFGenerator:
-    def __init__(self):
-        self.driver = get_chrome_driver()
+    def __init__(self, driver=None):
+        # A driver handed out by the DriverPool is reused, otherwise a fresh Chrome is started
+        self.driver = driver if driver is not None else get_chrome_driver()
+        self.page_count = 0
+
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+        # Size of the chunks the printed PDF is streamed to disk with
+        self.print_chunk_size = config.getint('capture', 'print_chunk_kb', fallback=512) * 1024
         self.print_ops = {
             "pageRanges": "1-1",
         }
 
-    def send_devtools(self, cmd, params=None):
-        resource = f"/session/{self.driver.session_id}/chromium/send_command_and_get_result"
-        url = self.driver.command_executor._url + resource
-        body = json.dumps({"cmd": cmd, "params": params})
-        response = self.driver.command_executor._request("POST", url, body)
-        if not response:
-            raise Exception(response.get("value"))
-        return response.get("value")
-
-    def get_pdf_from_html(self, path: str, target: str, print_options: dict = None):
-        self.driver.get(path)
-        try:
-            WebDriverWait(self.driver, 2).until(
-                staleness_of(self.driver.find_element(by=By.TAG_NAME, value="html"))
-            )
-        except TimeoutException:
-            calculated_print_options = {
-                "landscape": False,
-                "displayHeaderFooter": False,
-                "printBackground": True,
-                "preferCSSPageSize": True,
-            }
-            print_options = print_options if print_options is not None else self.print_ops
-            calculated_print_options.update(print_options)
-            result = self.send_devtools("Page.printToPDF", calculated_print_options)
-            result_data = base64.b64decode(result["data"])
-            write_to_a_file(result_data, target)
+    def print_current_page(self, target: str, print_options: dict = None, paper_name: str = None):
+        page = file_stem(target)
+        # Capture starts as soon as the page scan is painted instead of after a fixed wait
+        with metrics.stage("readiness", page=page):
+            wait_for_page_ready(self.driver, paper_name)
+        calculated_print_options = {
+            "landscape": False,
+            "displayHeaderFooter": False,
+            "printBackground": True,
+            "preferCSSPageSize": True,
+        }
+        print_options = print_options if print_options is not None else self.print_ops
+        calculated_print_options.update(print_options)
+        # Streamed to disk in chunks instead of coming back as one big base64 string
+        with metrics.stage("print", page=page) as record:
+            get_browser_cdp(self.driver).print_to_pdf(self.driver.current_window_handle, calculated_print_options,
+                                                      target, self.print_chunk_size)
+            record["bytes"] = file_size(target)
+        self.page_count += 1
 
     def close_driver(self):
+        close_browser_cdp(self.driver)
         self.driver.quit()
 
     def get_driver(self):
@@ -0,0 +1,61 @@
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+
+# Collects the page ids of the edition in page order: from the elements of the adapter's page list,
+# or else from the page currently open and every link / option / data attribute carrying a pgid, except
+# the Prev / Next buttons. Values are either a pgid url or the pgid itself
+PAGE_IDS_SCRIPT = """
+var selector = arguments[0], attribute = arguments[1], currentId = arguments[2], ids = [];
+var add = function (id) {
+    if (id && ids.indexOf(id) < 0) ids.push(id);
+};
+var pgid = function (value) {
+    var match = /^(\\d+)$|[?&]pgid=(\\d+)/i.exec((value || '').trim());
+    return match ? match[1] || match[2] : null;
+};
+if (selector) {
+    document.querySelectorAll(selector).forEach(function (element) { add(pgid(element.getAttribute(attribute))); });
+    if (ids.length) {
+        // The page the edition opens on is read first
+        if (ids.indexOf(currentId) < 1) return ids;
+        return [currentId].concat(ids.filter(function (id) { return id !== currentId; }));
+    }
+}
+// The edition opens on its first page, which is usually not linked from itself
+add(currentId);
+document.querySelectorAll("a[href*='pgid='], option[value*='pgid=']").forEach(function (element) {
+    if (element.id === 'Prev_Page' || element.id === 'Next_Page') return;
+    add(pgid(element.getAttribute('href') || element.getAttribute('value')));
+});
+document.querySelectorAll('[data-pgid]').forEach(function (element) { add(element.getAttribute('data-pgid')); });
+// Only the page currently open means the page list wasn't found
+return ids.length > 1 ? ids : [];
+"""
+
+
+def get_page_id(url):
+    page_ids = parse_qs(urlparse(url).query).get('pgid')
+    return page_ids[0] if page_ids else None
+
+
+def build_page_url(url, page_id):
+    # Same edition url, pointing to another page
+    parsed_url = urlparse(url)
+    query_params = parse_qs(parsed_url.query)
+    query_params['pgid'] = [page_id]
+    return urlunparse(parsed_url._replace(query=urlencode(query_params, doseq=True)))
+
+
+def discover_page_ids(driver, adapter):
+    """
+    Reads the page list of the edition shown by the driver once, up front.
+    Returns the page ids in page order, or an empty list when the page list can't be found.
+    """
+    current_page_id = get_page_id(driver.current_url)
+    try:
+        page_ids = driver.execute_script(PAGE_IDS_SCRIPT, adapter.page_list_selector, adapter.page_id_attribute,
+                                         current_page_id)
+    except Exception as err:
+        print(f"Couldn't read the page list of {adapter.paper_name}: {err}")
+        return []
+    print(f"Found {len(page_ids)} pages in {adapter.paper_name} paper.")
+    return page_ids
@@ -0,0 +1,111 @@
+import time
+
+from selenium.common import TimeoutException
+from selenium.webdriver.support.wait import WebDriverWait
+
+from CdpClient import get_browser_cdp
+from RetryPolicy import latency_history
+
+# Ready once the load event has fired, no resource has finished for idle_ms and the page image is loaded
+PAGE_READY_SCRIPT = """
+var idleMs = arguments[0];
+if (document.readyState !== 'complete' || location.href === 'about:blank') return false;
+if (window.__readyEntries === undefined) performance.setResourceTimingBufferSize(10000);
+var entries = performance.getEntriesByType('resource').length, now = performance.now();
+if (window.__readyEntries !== entries) {
+    window.__readyEntries = entries;
+    window.__readySince = now;
+    return false;
+}
+if (now - window.__readySince < idleMs) return false;
+var images = document.images;
+var page = null, area = 0;
+for (var i = 0; i < images.length; i++) {
+    var rect = images[i].getBoundingClientRect();
+    if (rect.width * rect.height > area) {
+        area = rect.width * rect.height;
+        page = images[i];
+    }
+}
+if (!page) return true;
+return page.complete && page.naturalWidth > 0;
+"""
+
+# Waits until the page image is decoded and two frames have been painted with it
+PAGE_PAINTED_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var images = document.images;
+var page = null, area = 0;
+for (var i = 0; i < images.length; i++) {
+    var rect = images[i].getBoundingClientRect();
+    if (rect.width * rect.height > area) {
+        area = rect.width * rect.height;
+        page = images[i];
+    }
+}
+var painted = function () {
+    requestAnimationFrame(function () { requestAnimationFrame(function () { done(true); }); });
+};
+if (page && page.decode) {
+    page.decode().then(painted, painted);
+} else {
+    painted();
+}
+"""
+
+
+# URL of the page scan as displayed (the resolution picked from srcset included)
+PAGE_IMAGE_URL_SCRIPT = """
+var images = document.images;
+var page = null, area = 0;
+for (var i = 0; i < images.length; i++) {
+    var rect = images[i].getBoundingClientRect();
+    if (rect.width * rect.height > area) {
+        area = rect.width * rect.height;
+        page = images[i];
+    }
+}
+return page ? (page.currentSrc || page.src) : null;
+"""
+
+
+def get_page_image_url(driver):
+    return driver.execute_script(PAGE_IMAGE_URL_SCRIPT)
+
+
+def wait_for_page_ready(driver, paper_name=None, timeout=None, idle_ms=500, idle_timeout=3):
+    """
+    Blocks until the page scan of the current page is painted, or the timeout expires.
+    Returns False on timeout, the page is captured anyway like before.
+    Without a timeout, the one learned from the site's readiness history is used (10 seconds at first).
+    All the waits share the timeout, the network idle signal is only waited for idle_timeout seconds.
+    """
+    timeout = timeout or latency_history.timeout("ready", 10, paper_name)
+    started = time.perf_counter()
+    deadline = started + timeout
+    try:
+        # The network idle signal comes from the DevTools lifecycle events when the connection is available.
+        # It is only given for a newly loaded document, after an in-page navigation the idle_ms guard is kept
+        try:
+            if get_browser_cdp(driver).wait_for_network_idle(driver.current_window_handle,
+                                                             min(idle_timeout, timeout)):
+                idle_ms = 0
+            else:
+                # Sites whose signal never fires would otherwise learn the idle wait as their readiness time
+                started = time.perf_counter()
+        except Exception as err:
+            print(f"DevTools lifecycle events are not available: {err}")
+
+        # In-page navigation (Next_Page clicks) keeps the same document, so the idle tracking starts over
+        driver.execute_script("window.__readyEntries = undefined;")
+        WebDriverWait(driver, max(0.1, deadline - time.perf_counter()), poll_frequency=0.1).until(
+            lambda d: d.execute_script(PAGE_READY_SCRIPT, idle_ms))
+        driver.set_script_timeout(max(0.1, deadline - time.perf_counter()))
+        driver.execute_async_script(PAGE_PAINTED_SCRIPT)
+        latency_history.record("ready", time.perf_counter() - started, paper_name)
+        return True
+    except TimeoutException:
+        # Recorded as taking the whole timeout, so that a site slower than its timeout gets a longer one
+        latency_history.record("ready", timeout, paper_name)
+        print(f"Page is not ready after {timeout} seconds: {driver.current_url}")
+        return False
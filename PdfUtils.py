@@ -2,25 +2,271 @@
 Created by Samba Chennamsetty on 6/14/2023.
 """
 
+import io
 import os
+import threading
 
 import PyPDF2
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
 
+from Metrics import file_size, file_stem, metrics
 
-def merge_pdfs(pdf_files, output_file):
-    try:
-        merger = PyPDF2.PdfMerger()
-        for pdf_file in pdf_files:
-            with open(pdf_file, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                merger.append(reader)
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is optional, without it only JPEG scans can be wrapped and nothing is downsampled
+    Image = None
 
-        with open(output_file, 'wb') as f:
-            merger.write(f)
+PDF_HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
 
-        # Delete the original files
-        for pdf_file in pdf_files:
+# Page attributes which can be inherited from the page tree of the source file
+INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+class StreamingPdfMerger:
+    """
+    Merges page files into output_file while the next pages are still being captured.
+    Every page is written to disk as soon as it is added (and its file deleted unless remove_pages
+    is False), so only the page being copied is held in memory whatever the number of pages.
+    Used as a context manager, the partial output_file is deleted when the block raises before close().
+    """
+
+    def __init__(self, output_file, remove_pages=True):
+        self.output_file = output_file
+        self.paper_name = file_stem(output_file)
+        self.remove_pages = remove_pages
+        self.missing_pages = []
+        self._stream = open(output_file, 'wb')
+        self._stream.write(PDF_HEADER)
+        self._offsets = {}
+        self._next_number = 3  # 1 is the catalog and 2 is the page tree, both written on close
+        self._kids = []
+        self._pending = {}
+        self._added = 0
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+
+    def abort(self):
+        # The page files are kept, only the unfinished paper is removed
+        with self._lock:
+            if self._stream.closed:
+                return
+            self._stream.close()
+        try:
+            os.remove(self.output_file)
+        except OSError as err:
+            print(f"Error while removing the unfinished {self.output_file}: {err}")
+
+    def add(self, pdf_file, index=None):
+        """
+        Adds a page file. Pages captured out of order must pass their index (0 based),
+        they are kept on disk until all the pages before them have been added.
+        """
+        with self._lock:
+            index = self._added if index is None else index
+            self._added += 1
+            self._pending[index] = pdf_file
+            while self._next_index in self._pending:
+                self._append_file(self._pending.pop(self._next_index))
+                self._next_index += 1
+
+    def close(self):
+        with self._lock, metrics.stage("merge_close", paper=self.paper_name) as record:
+            # Pages which never arrived are skipped
+            for index in sorted(self._pending):
+                self._append_file(self._pending.pop(index))
+
+            kids = " ".join(f"{number} 0 R" for number in self._kids)
+            self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+            self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._kids)} >>".encode())
+
+            xref_offset = self._stream.tell()
+            self._stream.write(f"xref\n0 {self._next_number}\n0000000000 65535 f \n".encode())
+            for number in range(1, self._next_number):
+                if number in self._offsets:
+                    self._stream.write(f"{self._offsets[number]:010d} 00000 n \n".encode())
+                else:
+                    self._stream.write(b"0000000000 65535 f \n")
+            self._stream.write(f"trailer\n<< /Size {self._next_number} /Root 1 0 R >>\n"
+                               f"startxref\n{xref_offset}\n%%EOF\n".encode())
+            record["bytes"] = self._stream.tell()
+            self._stream.close()
+        return self.output_file
+
+    def _append_file(self, pdf_file):
+        if not os.path.exists(pdf_file):
+            print(f"Page {pdf_file} is missing, skipping it.")
+            self.missing_pages.append(pdf_file)
+            return
+        try:
+            with metrics.stage("merge", paper=self.paper_name, page=file_stem(pdf_file)) as record:
+                reader = PyPDF2.PdfReader(pdf_file)
+                id_map = {}
+                for page in reader.pages:
+                    self._kids.append(self._copy_page(page, id_map))
+                record["bytes"] = file_size(pdf_file)
+            metrics.page_ready()
+        except Exception as err:
+            print(f"Couldn't merge {pdf_file}: {err}")
+            self.missing_pages.append(pdf_file)
+
+        # Delete the original file
+        if self.remove_pages:
             os.remove(pdf_file)
 
-    except Exception as err:
-        print(f"Merge files failed:  {err}")
+    def _copy_page(self, page, id_map):
+        page_dict = DictionaryObject({key: value for key, value in page.items() if key != "/Parent"})
+        for key in INHERITABLE_PAGE_KEYS:
+            parent = page.get("/Parent")
+            while key not in page_dict and parent is not None:
+                parent = parent.get_object()
+                if key in parent:
+                    page_dict[key] = parent[key]
+                parent = parent.get("/Parent")
+
+        queue = []
+        if page.indirect_reference is not None:
+            number = self._number_for(page.indirect_reference, id_map, queue)
+            queue.clear()
+        else:
+            number = self._allocate_number()
+        body = self._serialize(page_dict, id_map, queue).replace(b"<<", b"<< /Parent 2 0 R", 1)
+        self._write_object(number, body)
+
+        # Everything the page refers to (contents, fonts, images...) is copied once per source file
+        while queue:
+            reference, target = queue.pop()
+            self._write_object(target, self._serialize(reference.get_object(), id_map, queue))
+        return number
+
+    def _allocate_number(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _number_for(self, reference, id_map, queue):
+        key = (reference.idnum, reference.generation)
+        if key not in id_map:
+            id_map[key] = self._allocate_number()
+            queue.append((reference, id_map[key]))
+        return id_map[key]
+
+    def _serialize(self, obj, id_map, queue):
+        if isinstance(obj, IndirectObject):
+            return f"{self._number_for(obj, id_map, queue)} 0 R".encode()
+        if isinstance(obj, ArrayObject):
+            return b"[" + b" ".join(self._serialize(item, id_map, queue) for item in obj) + b"]"
+        if isinstance(obj, DictionaryObject):
+            skipped = ["/Length"] if isinstance(obj, StreamObject) else []
+            if obj.get("/Type") == "/Page":
+                # Links to other pages of the source file must not drag its page tree along
+                skipped.append("/Parent")
+            items = b"".join(self._serialize(key, id_map, queue) + b" " + self._serialize(value, id_map, queue) + b"\n"
+                             for key, value in obj.items() if key not in skipped)
+            if isinstance(obj, StreamObject):
+                data = obj._data
+                return (b"<<\n" + items + f"/Length {len(data)}\n>>\nstream\n".encode() + data + b"\nendstream")
+            return b"<<\n" + items + b">>"
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer, None)
+        return buffer.getvalue()
+
+    def _write_object(self, number, body):
+        self._offsets[number] = self._stream.tell()
+        self._stream.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+
+def get_jpeg_info(jpeg_data):
+    # Walks the JPEG markers until the start of frame, which holds the image size
+    index = 2
+    while index + 9 < len(jpeg_data):
+        if jpeg_data[index] != 0xFF:
+            break
+        marker = jpeg_data[index + 1]
+        if marker == 0xFF:
+            index += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            index += 2
+            continue
+        length = int.from_bytes(jpeg_data[index + 2:index + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(jpeg_data[index + 5:index + 7], 'big')
+            width = int.from_bytes(jpeg_data[index + 7:index + 9], 'big')
+            components = jpeg_data[index + 9]
+            return width, height, components
+        index += 2 + length
+    raise ValueError("Not a valid JPEG image.")
+
+
+def jpeg_to_pdf(jpeg_data, output_file, dpi=150):
+    """
+    Wraps a JPEG page scan into a single page PDF as it is (DCTDecode), without re-encoding it.
+    """
+    width, height, components = get_jpeg_info(jpeg_data)
+    color_spaces = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}
+    if components not in color_spaces:
+        raise ValueError(f"Unsupported JPEG with {components} components.")
+
+    page_width = round(width * 72 / dpi, 2)
+    page_height = round(height * 72 / dpi, 2)
+    content = f"q {page_width} 0 0 {page_height} 0 0 cm /Im0 Do Q".encode()
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width} {page_height}] "
+        f"/Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R >>".encode(),
+        f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+        f"/ColorSpace {color_spaces[components]} /BitsPerComponent 8 /Filter /DCTDecode "
+        f"/Length {len(jpeg_data)} >>\nstream\n".encode() + jpeg_data + b"\nendstream",
+        f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream",
+    ]
+
+    # Written next to the target first, so an interrupted write never leaves a truncated page behind
+    with open(f"{output_file}.part", 'wb') as f:
+        f.write(PDF_HEADER)
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref_offset = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    os.replace(f"{output_file}.part", output_file)
+
+
+def image_to_pdf(image_data, output_file, dpi=150, downsample_dpi=None, quality=85):
+    """
+    Wraps a page scan into a single page PDF. JPEG scans are embedded as they are; other formats, and
+    scans downsampled to downsample_dpi, are encoded to JPEG once with Pillow.
+    Returns False when the scan can't be converted.
+    """
+    is_jpeg = image_data.startswith(b"\xff\xd8")
+    scale = downsample_dpi / dpi if downsample_dpi and downsample_dpi < dpi else 1
+    if is_jpeg and scale == 1:
+        jpeg_to_pdf(image_data, output_file, dpi)
+        return True
+    if Image is None:
+        print("Pillow is not installed, the page scan can't be converted.")
+        return False
+
+    image = Image.open(io.BytesIO(image_data))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if scale != 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    jpeg_buffer = io.BytesIO()
+    image.save(jpeg_buffer, format="JPEG", quality=quality, optimize=True)
+    # The page keeps its size, only the resolution is lowered
+    jpeg_to_pdf(jpeg_buffer.getvalue(), output_file, dpi * scale)
+    return True
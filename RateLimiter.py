@@ -0,0 +1,105 @@
+import configparser
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from Metrics import metrics
+
+
+class TokenBucket:
+    """
+    Allows requests_per_second requests on average with bursts of up to `burst` requests,
+    and at most max_in_flight of them at the same time. A rate of 0 doesn't limit the rate.
+    """
+
+    def __init__(self, requests_per_second, burst, max_in_flight):
+        self.rate = requests_per_second
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+
+    def take(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """
+    One token bucket per hostname shared by every worker, so papers running at the same time never
+    send a site more than its configured pages per second and requests in flight.
+    The limits of a site are read from its [rate_limit:<hostname>] section, [rate_limit] has the defaults.
+    """
+
+    def __init__(self):
+        self.load()
+
+    def load(self):
+        self.config = configparser.ConfigParser()
+        self.config.read('config.properties')
+
+        self.enabled = self.config.getboolean('rate_limit', 'enabled', fallback=True)
+        self.requests_per_second = self.config.getfloat('rate_limit', 'requests_per_second', fallback=4)
+        self.burst = self.config.getfloat('rate_limit', 'burst', fallback=8)
+        self.max_in_flight = self.config.getint('rate_limit', 'max_in_flight', fallback=6)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, url):
+        hostname = urlparse(url).hostname
+        if not self.enabled or not hostname:
+            return None
+        with self._lock:
+            if hostname not in self._buckets:
+                section = f"rate_limit:{hostname}"
+                self._buckets[hostname] = TokenBucket(
+                    self.config.getfloat(section, 'requests_per_second', fallback=self.requests_per_second),
+                    self.config.getfloat(section, 'burst', fallback=self.burst),
+                    self.config.getint(section, 'max_in_flight', fallback=self.max_in_flight))
+            return self._buckets[hostname]
+
+    @contextmanager
+    def request(self, url):
+        """
+        Holds one of the site's in-flight slots for the block, after waiting for its turn.
+        """
+        bucket = self._bucket(url)
+        if bucket is None:
+            yield
+            return
+        with metrics.stage("throttle"):
+            bucket.in_flight.acquire()
+            bucket.take()
+        try:
+            yield
+        finally:
+            bucket.in_flight.release()
+
+    def in_flight_limit(self, url):
+        # None when the site isn't limited
+        bucket = self._bucket(url)
+        return bucket.max_in_flight if bucket is not None else None
+
+    def wait(self, url):
+        # For navigations which are only started, e.g. a new tab, the slot can't be held until they finish
+        bucket = self._bucket(url)
+        if bucket is not None:
+            with metrics.stage("throttle"):
+                bucket.take()
+
+
+# Shared by every worker, the buckets are created on the first request to each site
+rate_limiter = RateLimiter()
@@ -0,0 +1,51 @@
+import configparser
+import re
+from urllib.parse import urlparse
+
+from CdpClient import get_browser_cdp
+
+
+def read_patterns(config, section, option):
+    # Patterns are separated by commas or new lines
+    return [pattern for pattern in re.split(r"[,\s]+", config.get(section, option, fallback='')) if pattern]
+
+
+class RequestBlocker:
+    """
+    Keeps ads, trackers, social widgets and consent popups from loading while the pages are captured,
+    so only the page scan and the scripts showing it are downloaded and rendered.
+    [request_blocking] has the patterns blocked on every site, a [request_blocking:<hostname>] section
+    adds the block and allow patterns of one site. Allow patterns win over block patterns.
+    """
+
+    def __init__(self):
+        self.config = configparser.ConfigParser()
+        self.config.read('config.properties')
+
+        self.enabled = self.config.getboolean('request_blocking', 'enabled', fallback=True)
+        self.block = read_patterns(self.config, 'request_blocking', 'block')
+        self.allow = read_patterns(self.config, 'request_blocking', 'allow')
+        self.resource_types = read_patterns(self.config, 'request_blocking', 'resource_types')
+
+    def rules(self, url):
+        section = f"request_blocking:{urlparse(url).hostname}"
+        block = self.block + read_patterns(self.config, section, 'block')
+        allow = self.allow + read_patterns(self.config, section, 'allow')
+        resource_types = read_patterns(self.config, section, 'resource_types') or self.resource_types
+        return block, allow, resource_types
+
+    def apply(self, driver, url):
+        """
+        Sets the rules of url's site on the current tab before url is opened in it, they stay until the
+        tab is used for another site.
+        """
+        if not self.enabled or not url.startswith("http"):
+            return
+        try:
+            get_browser_cdp(driver).block_requests(driver.current_window_handle, *self.rules(url))
+        except Exception as err:
+            print(f"Couldn't block the ads and trackers of {url}: {err}")
+
+
+# Shared by every browser, the rules are set on each tab before it opens a page
+request_blocker = RequestBlocker()
@@ -0,0 +1,138 @@
+import configparser
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from Metrics import metrics
+
+
+class LatencyHistory:
+    """
+    Keeps the last latencies of every operation (load, navigate, ready, fetch...) by site across runs,
+    so that each site gets timeouts fitting how fast it really is: the p95 of its history times a
+    safety factor, within [min_timeout, max_timeout]. Sites without enough history get the default.
+    """
+
+    def __init__(self):
+        self.load()
+
+    def load(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.history_file = config.get('retry', 'history_file', fallback='latency_history.json')
+        self.history_size = config.getint('retry', 'history_size', fallback=100)
+        self.min_samples = config.getint('retry', 'min_samples', fallback=5)
+        self.timeout_factor = config.getfloat('retry', 'timeout_factor', fallback=1.5)
+        self.min_timeout = config.getfloat('retry', 'min_timeout', fallback=2)
+        self.max_timeout = config.getfloat('retry', 'max_timeout', fallback=60)
+        # Optional elements (popups, ads...) missing from the last min_samples pages are only looked for briefly,
+        # and with the full timeout again every missing_probe_every times in case they came back
+        self.missing_timeout = config.getfloat('retry', 'missing_timeout', fallback=0.5)
+        self.missing_probe_every = config.getint('retry', 'missing_probe_every', fallback=10)
+        self._lock = threading.Lock()
+        self._history = {}
+        if os.path.exists(self.history_file):
+            try:
+                with open(self.history_file) as f:
+                    self._history = json.load(f)
+            except ValueError:
+                print(f"Ignoring the unreadable latency history: {self.history_file}")
+
+    def _key(self, site, operation):
+        # The site is the paper being downloaded by the current thread when it isn't given
+        return f"{site or metrics.current_paper() or 'default'}/{operation}"
+
+    def record(self, operation, seconds, site=None):
+        key = self._key(site, operation)
+        with self._lock:
+            samples = self._history.setdefault(key, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.history_size]
+
+    def record_presence(self, operation, found, site=None, brief=False):
+        # 1 when the element was found, 0 when it was missing, -1 when it was missing from a brief look only
+        key = self._key(site, f"{operation}/found")
+        with self._lock:
+            samples = self._history.setdefault(key, [])
+            samples.append(1 if found else -1 if brief else 0)
+            del samples[:-self.history_size]
+
+    def is_missing(self, operation, site=None):
+        with self._lock:
+            samples = self._history.get(self._key(site, f"{operation}/found"), [])
+        if len(samples) < self.min_samples or 1 in samples[-self.min_samples:]:
+            return False
+        # Looked for with the full timeout once the last missing_probe_every looks were all brief ones
+        brief_looks = 0
+        for sample in reversed(samples):
+            if sample != -1:
+                break
+            brief_looks += 1
+        return brief_looks < self.missing_probe_every - 1
+
+    def timeout(self, operation, default, site=None):
+        with self._lock:
+            samples = sorted(self._history.get(self._key(site, operation), []))
+        if len(samples) < self.min_samples:
+            return default
+        p95 = samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)]
+        return round(min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_factor)), 1)
+
+    def save(self):
+        with self._lock:
+            history = dict(self._history)
+        try:
+            with open(self.history_file, 'w') as f:
+                json.dump(history, f, indent=2, sort_keys=True)
+        except OSError as err:
+            print(f"Error while saving the latency history: {self.history_file}: {err}")
+
+
+class RetryPolicy:
+    """
+    Retries a failing step (a page capture, a navigation, a fetch...) with exponential backoff and
+    jitter, so that retries of pages failing together don't hit the site at the same moment.
+    """
+
+    def __init__(self):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.attempts = config.getint('retry', 'attempts', fallback=3)
+        self.backoff = config.getfloat('retry', 'backoff', fallback=1.0)
+        self.max_backoff = config.getfloat('retry', 'max_backoff', fallback=30)
+        self.jitter = config.getfloat('retry', 'jitter', fallback=0.5)
+
+    def delay(self, attempt):
+        # attempt is 0 based: backoff, 2 x backoff, 4 x backoff... each spread by +/- jitter
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def call(self, action, description, page=None, on_retry=None):
+        """
+        Calls action() until it succeeds or the attempts are exhausted, then its last error is raised.
+        on_retry() is called before every new attempt, e.g. to reload the page.
+        """
+        for attempt in range(self.attempts):
+            try:
+                return action()
+            except Exception as err:
+                if attempt + 1 >= self.attempts:
+                    raise
+                delay = self.delay(attempt)
+                print(f"{description} failed, retrying in {delay:.1f} seconds: {err}")
+                with metrics.stage("retry", page=page) as record:
+                    record["retries"] = 1
+                    record["error"] = str(err)
+                    time.sleep(delay)
+                    if on_retry is not None:
+                        on_retry()
+
+
+# Shared by every module, the history is saved at the end of the run
+latency_history = LatencyHistory()
+retry_policy = RetryPolicy()
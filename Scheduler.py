@@ -0,0 +1,52 @@
+import configparser
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def job_label(key):
+    # Jobs are keyed by paper name, or by (paper name, edition folder) in a backfill
+    return " ".join(key) if isinstance(key, tuple) else key
+
+
+def job_site(key):
+    return key[0] if isinstance(key, tuple) else key
+
+
+class PaperScheduler:
+
+    def __init__(self, max_workers=None):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        # Number of papers downloaded at the same time, each one gets its own browser
+        self.max_workers = max_workers or config.getint('scheduler', 'max_workers', fallback=3)
+        # Editions of the same paper downloaded at the same time, so a backfill doesn't hammer one site
+        self.max_jobs_per_site = max(1, config.getint('scheduler', 'max_jobs_per_site', fallback=1))
+
+    def run(self, jobs):
+        """
+        Runs every job of the given {paper name or (paper name, date): callable} dict on a bounded pool of
+        workers, with at most max_jobs_per_site jobs of the same paper at a time.
+        A failing job never stops the others, the error is returned in its slot instead.
+        """
+        results = {}
+        pending = list(jobs.items())
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="paper") as executor:
+            while pending or running:
+                # Jobs of sites at their limit wait for one of their jobs to finish
+                for key, job in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    if sum(job_site(other) == job_site(key) for other in running.values()) < self.max_jobs_per_site:
+                        pending.remove((key, job))
+                        running[executor.submit(job)] = key
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        results[key] = future.result()
+                        print(f"{job_label(key)} paper has been finished.")
+                    except Exception as err:
+                        print(f"Exception in {job_label(key)} paper: {err}")
+                        results[key] = err
+        return results
@@ -0,0 +1,68 @@
+from functools import partial
+
+from BrowserActions import accept_cookies, add_right_zero, add_right_zero_to_elements, find_and_click_buttons, \
+    hide_social_share_button, navigate_to_next_eenadu_page, navigate_to_next_page, skip_ads
+from Constants import VISALANDRA, ANDHARAJOTHI, ANDHRA_PRABHA, SAKSHI, EENADU
+
+accept_gdpr_cookies = partial(accept_cookies, "gdprContinue")
+
+
+class SiteAdapter:
+    """
+    Describes how a page by page e-paper is read, everything else is done by the same engine for all papers.
+
+    url_key: key of the paper url in the [newspapers] section, formatted with the dd/mm/yyyy date
+    pages: number of pages used when the page list of the edition can't be found
+    page_list_selector: CSS selector of the elements listing the pages, when none is found (or None)
+        the pgid links of the page are used instead
+    page_id_attribute: attribute of those elements holding the page id or a pgid url
+    direct_pages: opens the pages by their pgid url in parallel tabs instead of navigating from page to page
+    wait_for_pgid: waits for the site to redirect to the first page (pgid in the url) on the first load
+    popups: called once with the driver after the first load (cookies, ads...)
+    reload: opens the first page again after the popups are dismissed
+    after_load: called with the driver once the first page is shown
+    navigate: called with (driver, current url) to go to the next page
+    after_navigate: called with the driver after every navigation
+    """
+
+    def __init__(self, paper_name, url_key, pages=None, page_list_selector=None, page_id_attribute=None,
+                 direct_pages=True, wait_for_pgid=True, popups=(), reload=True,
+                 after_load=(hide_social_share_button, add_right_zero), navigate=navigate_to_next_page,
+                 after_navigate=(add_right_zero_to_elements,)):
+        self.paper_name = paper_name
+        self.url_key = url_key
+        self.pages = pages
+        self.page_list_selector = page_list_selector
+        self.page_id_attribute = page_id_attribute
+        self.direct_pages = direct_pages
+        self.wait_for_pgid = wait_for_pgid
+        self.popups = popups
+        self.reload = reload
+        self.after_load = after_load
+        self.navigate = navigate
+        self.after_navigate = after_navigate
+
+
+SITE_ADAPTERS = {
+    SAKSHI: SiteAdapter(
+        SAKSHI, 'sakshi_paper_url', pages=8,
+        popups=(find_and_click_buttons, accept_gdpr_cookies, skip_ads, hide_social_share_button),
+    ),
+    ANDHARAJOTHI: SiteAdapter(
+        ANDHARAJOTHI, 'abn_paper_url', pages=7,
+        popups=(accept_gdpr_cookies, hide_social_share_button),
+    ),
+    VISALANDRA: SiteAdapter(
+        VISALANDRA, 'visalandra_paper_url', pages=8, wait_for_pgid=False, reload=False,
+        popups=(accept_gdpr_cookies, hide_social_share_button), after_load=(add_right_zero,),
+    ),
+    ANDHRA_PRABHA: SiteAdapter(
+        ANDHRA_PRABHA, 'andhra_prabha_paper_url', pages=12,
+        popups=(accept_gdpr_cookies, hide_social_share_button),
+    ),
+    EENADU: SiteAdapter(
+        EENADU, 'eenadu_paper_url', page_list_selector="#myPageList option", page_id_attribute="value",
+        direct_pages=False, wait_for_pgid=False, after_load=(), navigate=navigate_to_next_eenadu_page,
+        after_navigate=(),
+    ),
+}
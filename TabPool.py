@@ -0,0 +1,61 @@
+import configparser
+from collections import deque
+
+from RateLimiter import rate_limiter
+from RequestBlocker import request_blocker
+
+
+class TabPool:
+    """
+    Renders several pages of the same edition at once in up to `size` tabs of one browser.
+    As soon as the oldest tab is captured, its place is taken by a new tab loading the next page,
+    so `size` pages are always loading while one is being printed.
+    A loading tab is a request in flight to the site, so there are never more tabs than the site's
+    max_in_flight.
+    """
+
+    def __init__(self, driver, size=None):
+        config = configparser.ConfigParser()
+        config.read('config.properties')
+
+        self.driver = driver
+        self.size = size or config.getint('capture', 'max_tabs', fallback=4)
+
+    def _open_tab(self, url):
+        # A new tab starts on about:blank, the readiness check waits for the page to replace it
+        self.driver.switch_to.new_window('tab')
+        request_blocker.apply(self.driver, url)
+        # Only starts the navigation, the next tabs are opened while this one loads
+        rate_limiter.wait(url)
+        self.driver.execute_script("window.location.href = arguments[0];", url)
+        return self.driver.current_window_handle
+
+    def run(self, pages, capture):
+        """
+        pages: list of (url, page) in page order, capture(page) is called with the tab of that page active.
+        """
+        main_window = self.driver.current_window_handle
+        waiting = deque(pages)
+        loading = deque()
+        size = self.size
+        if pages:
+            size = min(size, rate_limiter.in_flight_limit(pages[0][0]) or size)
+        try:
+            while waiting or loading:
+                while waiting and len(loading) < size:
+                    url, page = waiting.popleft()
+                    loading.append((self._open_tab(url), page))
+
+                window, page = loading.popleft()
+                self.driver.switch_to.window(window)
+                try:
+                    capture(page)
+                except Exception as err:
+                    print(f"Exception while capturing {page}: {err}")
+                self.driver.close()
+        finally:
+            # Tabs left open by a failure are closed so that the browser goes back to the pool clean
+            for window, page in loading:
+                self.driver.switch_to.window(window)
+                self.driver.close()
+            self.driver.switch_to.window(main_window)
@@ -0,0 +1,122 @@
+"""
+Uploads against the fake Dropbox of the benchmark: python -m unittest TestDropbox
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from BenchmarkFixtures import FakeDropbox
+from DropboxManager import DropboxManager, UploadQueue, load_json_file
+
+FOLDER = "2026-10-19"
+PAPER = f"{FOLDER}/Sakshi.pdf"
+DATA = bytes(range(35))
+
+
+class InterruptedDropbox(FakeDropbox):
+    """
+    Loses the connection on the given append, after Dropbox received the chunk when `received` is set.
+    """
+
+    def __init__(self, failing_append, received=False):
+        super().__init__()
+        self.failing_append = failing_append
+        self.received = received
+        self.appends = 0
+
+    def files_upload_session_append_v2(self, data, cursor, close=False):
+        self.appends += 1
+        if self.appends == self.failing_append:
+            if self.received:
+                super().files_upload_session_append_v2(data, cursor, close)
+            raise ConnectionError("connection lost")
+        super().files_upload_session_append_v2(data, cursor, close)
+
+
+class BatchingDropbox(FakeDropbox):
+    """
+    Records the number of files committed by every finish batch call.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def files_upload_session_finish_batch_v2(self, entries):
+        self.batches.append(len(entries))
+        return super().files_upload_session_finish_batch_v2(entries)
+
+
+class TestUploadResume(unittest.TestCase):
+
+    def setUp(self):
+        self.current_directory = os.getcwd()
+        self.work_directory = tempfile.mkdtemp(prefix="dropbox-")
+        os.chdir(self.work_directory)
+        os.makedirs(FOLDER)
+        with open(PAPER, 'wb') as f:
+            f.write(DATA)
+
+    def tearDown(self):
+        os.chdir(self.current_directory)
+        shutil.rmtree(self.work_directory, ignore_errors=True)
+
+    def interrupted_upload(self, fake_dropbox):
+        manager = DropboxManager(fake_dropbox)
+        manager.chunk_size = 10
+        with self.assertRaises(ConnectionError):
+            manager.upload_file(PAPER, FOLDER)
+        return manager
+
+    def assert_uploaded(self, manager, fake_dropbox, sessions):
+        self.assertEqual(fake_dropbox.files[f"/{PAPER}"], DATA)
+        self.assertEqual(fake_dropbox._ids, sessions)
+        self.assertNotIn(PAPER, load_json_file(manager.sessions_file))
+        self.assertTrue(manager.is_uploaded(PAPER))
+        self.assertFalse(os.path.exists(PAPER))
+
+    def test_resumes_from_the_persisted_cursor(self):
+        fake_dropbox = InterruptedDropbox(failing_append=2)
+        manager = self.interrupted_upload(fake_dropbox)
+        self.assertEqual(load_json_file(manager.sessions_file)[PAPER]['offset'], 20)
+
+        manager.upload_file(PAPER, FOLDER)
+        self.assert_uploaded(manager, fake_dropbox, sessions=1)
+
+    def test_continues_from_the_offset_dropbox_has(self):
+        # The chunk got to Dropbox but its offset was never persisted
+        fake_dropbox = InterruptedDropbox(failing_append=2, received=True)
+        manager = self.interrupted_upload(fake_dropbox)
+        self.assertEqual(load_json_file(manager.sessions_file)[PAPER]['offset'], 20)
+
+        manager.upload_file(PAPER, FOLDER)
+        self.assert_uploaded(manager, fake_dropbox, sessions=1)
+
+    def test_starts_over_when_the_session_expired(self):
+        fake_dropbox = InterruptedDropbox(failing_append=2)
+        manager = self.interrupted_upload(fake_dropbox)
+        fake_dropbox._sessions.clear()
+
+        manager.upload_file(PAPER, FOLDER)
+        self.assert_uploaded(manager, fake_dropbox, sessions=2)
+
+    def test_queue_commits_every_paper_with_one_batch(self):
+        other_paper = f"{FOLDER}/Eenadu.pdf"
+        with open(other_paper, 'wb') as f:
+            f.write(DATA)
+        fake_dropbox = BatchingDropbox()
+        manager = DropboxManager(fake_dropbox)
+        upload_queue = UploadQueue(manager)
+        upload_queue.submit(PAPER, FOLDER)
+        upload_queue.submit(other_paper, FOLDER)
+        upload_queue.join()
+
+        self.assertEqual(fake_dropbox.batches, [2])
+        self.assertEqual(fake_dropbox.files[f"/{other_paper}"], DATA)
+        self.assertTrue(manager.is_uploaded(PAPER) and manager.is_uploaded(other_paper))
+
+
+if __name__ == "__main__":
+    unittest.main()
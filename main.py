@@ -2,248 +2,216 @@
 Created by Samba Chennamsetty on 6/14/2023.
 """
 
-import base64
+import argparse
 import configparser
-import json
-import time
-from datetime import date, timedelta
-
-import requests
-from selenium.common import TimeoutException
-from selenium.webdriver.support.expected_conditions import staleness_of
-
-from Constants import PRAJASAKTI_MAIN, PRAJASAKTI_DT, VISALANDRA, VAARTHA, ANDHARAJOTHI, SAKSHI, EENADU, ANDHRA_PRABHA
-from DropboxManager import DropboxManager, remove_folder
-from PDFGenerator import PDFGenerator, write_to_a_file
-from PdfUtils import merge_pdfs
-
-
-def accept_cookies(cookie, driver):
-    try:
-        accept_cookies_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.ID, cookie)))
-        accept_cookies_button.click()
-    except Exception as e:
-        print(f"Could not find or click 'Accept Cookies' button: {e}")
+import os
+import threading
+from functools import partial
 
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-def add_right_zero_to_elements(driver):
-    try:
-        # Locate and modify the "Next_Page" element
-        next_page_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "Next_Page"))
-        )
-        driver.execute_script("arguments[0].style.right = '0px';", next_page_element)
-
-        # Locate and modify the "Prev_Page" element
-        prev_page_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "Prev_Page"))
-        )
-        driver.execute_script("arguments[0].style.left = '0px';", prev_page_element)
-
-    except Exception as e:
-        print(f"Error modifying style: {e}")
-
-
-def add_right_zero(driver):
-    try:
-        # Wait for the element with id 'Next_Page' to be present
-        next_page_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "Next_Page"))
-        )
-
-        # Execute JavaScript to add 'right: 0px' style
-        driver.execute_script("arguments[0].style.right = '0px';", next_page_element)
-
-    except Exception as e:
-        print(f"Error modifying style: {e}")
-
-def find_and_click_buttons(driver):
-    try:
-        # Wait for both buttons with id 'button-1' to be present
-        buttons = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.ID, "button-1"))
-        )
-
-        # Loop through found buttons and click based on text content
-        for button in buttons:
-            text = button.text
-            if text == "X":
-                button.click()
-            elif text == "x":
-                button.click()
-
-    except Exception as e:
-        print(f"Could not find or click buttons: {e}")
-
-def hide_social_share_button(driver):
-    try:
-        # Wait for the social share button to be present
-        social_share_button = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "social_share_box_Container"))
-        )
-
-        # Use JavaScript to hide the element
-        driver.execute_script("arguments[0].style.display = 'none';", social_share_button)
-        #print("Social share button hidden.")
-    except Exception as e:
-        print(f"Could not find or hide social share button: {e}")
-
-def load_page(driver, url):
-    driver.get(url)
-    WebDriverWait(driver, 10).until(EC.url_contains('pgid'))  # Wait until the current URL contains 'pgid'
-
-
-def navigate_to_next_eenadu_page(driver):
-    try:
-        next_page = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//span[@data-original-title='Next Page']")))
-        next_page.click()
-    except Exception as err:
-        print(f"Couldn't find the next page..! Error: {err}")
-
-
-def get_number_of_pages(driver):
-    try:
-        # Locate the select element by its ID
-        select_element = driver.find_element(By.ID, "myPageList")
-
-        # Get all options within the select element
-        options = select_element.find_elements(By.TAG_NAME, "option")
-
-        # Count the number of options
-        num_options = len(options)
-
-        return num_options
-    except Exception as e:
-        print(f"Error finding options: {e}")
-
-
-def navigate_to_next_page(driver, next_url):
-    try:
-        next_page = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.ID, 'Next_Page')))
-        next_page.click()
-        hide_social_share_button(driver)
-        WebDriverWait(driver, 5).until(lambda driver: driver.current_url != next_url)
-    except Exception as err:
-        print(f"Couldn't find the next page..! Error: {err}")
-
-
-def download_surya_pdf_files(driver, url, filename, xpath_expression):
-    driver.get(url)
-
-    try:
-        if xpath_expression:
-            new_elements = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, xpath_expression)))
-            new_elements.click()
-
-            element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "btn-pdfdownload")))
-            href_value = element.get_attribute("href")
-            response = requests.get(href_value)
-
-            if response.status_code == 200:
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                print(f"{filename} downloaded successfully.")
-            else:
-                print(f"Failed to download {filename}.")
-        else:
-            print("Invalid XPath expression.")
-
-    except Exception as err:
-        print(f"Exception while downloading {filename}: {err}")
-
-
-def skip_ads(driver):
-    try:
-        button = WebDriverWait(driver, 3).until(
-            EC.presence_of_element_located((By.XPATH, "//button[text()='SKIP']"))
-        )
-        button.click()
-    except Exception as err:
-        print(f"Exception in Skip ads: {err}")
+from BrowserActions import load_page, open_url, reload_current_page, wait_until
+from CaptureCache import CaptureCache
+from Constants import PRAJASAKTI_MAIN, PRAJASAKTI_DT, VISALANDRA, VAARTHA, ANDHARAJOTHI, SAKSHI, EENADU, \
+    ANDHRA_PRABHA, SURYA_MAIN, SURYA_DT, VAARTHA_MAIN
+from DirectFetcher import PrajasaktiFetcher
+from DriverPool import DriverPool
+from DropboxManager import DropboxManager, UploadQueue, remove_folder
+from EditionDates import edition_dates, edition_folder, next_edition_date, parse_edition_date
+from HttpDownloader import HttpDownloader
+from ImageCapture import ImageCapture
+from Metrics import file_size, file_stem, metrics
+from PDFGenerator import PDFGenerator
+from PageDiscovery import build_page_url, discover_page_ids, get_page_id
+from PageReadiness import wait_for_page_ready
+from PdfUtils import StreamingPdfMerger
+from RateLimiter import rate_limiter
+from RetryPolicy import latency_history, retry_policy
+from Scheduler import PaperScheduler
+from SiteAdapters import SITE_ADAPTERS
+from TabPool import TabPool
+
+# Files produced by every paper, a paper is done for a date once all of them are in Dropbox
+PAPER_FILES = {
+    "prajasakthi": (PRAJASAKTI_MAIN, PRAJASAKTI_DT),
+    "andhra_prabha": (ANDHRA_PRABHA,),
+    "surya": (SURYA_MAIN, SURYA_DT),
+    "visalandra": (VISALANDRA,),
+    "vaartha": (VAARTHA_MAIN,),
+    "eenadu": (EENADU,),
+    "sakshi": (SAKSHI,),
+    "andhra_jyothi": (ANDHARAJOTHI,),
+}
+
+# Papers whose site only offers the latest edition, they can't be backfilled
+LATEST_EDITION_ONLY = ("surya", "vaartha")
+
+
+def get_surya_pdf_href(driver, url, xpath_expression):
+    open_url(driver, url)
+
+    new_elements = wait_until(driver, EC.element_to_be_clickable((By.XPATH, xpath_expression)), "pdf_link", 10)
+    rate_limiter.wait(driver.current_url)
+    new_elements.click()
+
+    element = wait_until(driver, EC.presence_of_element_located((By.CLASS_NAME, "btn-pdfdownload")), "pdf_link", 10)
+    return element.get_attribute("href")
 
 
 class NewspaperDownloader:
-    def __init__(self):
+    def __init__(self, dropbox_client=None):
         # Loading config file
         self.config = configparser.ConfigParser()
         self.config.read('config.properties')
 
-        # Today date in String format
-        self.today_date = date.today()
-        self.today_date = self.today_date + timedelta(days=1)
-        self.today_date_str = self.today_date.strftime("%Y-%m-%d")
+        # Tomorrow's edition, unless other dates are given to execute_download
+        self.default_edition_date = next_edition_date()
+        self.skip_completed = self.config.getboolean('backfill', 'skip_completed', fallback=True)
+        self.max_days = self.config.getint('backfill', 'max_days', fallback=31)
 
-        # Initializing PDFGenerator Class
-        self.pdf_generator = PDFGenerator()
-        self.driver = self.pdf_generator.get_driver()
+        # Every paper runs on its own worker thread with its own browser session and edition date
+        self._local = threading.local()
+        self.scheduler = PaperScheduler()
+        self.capture_cache = CaptureCache()
+        self.image_capture = ImageCapture()
+        self.http_downloader = HttpDownloader()
+        self.driver_pool = DriverPool()
+
+        # Prajasakti pages can be fetched without a browser
+        self.prajasakti_fetch_mode = self.config.get('prajasakthi', 'fetch_mode', fallback='direct')
+        self.prajasakti_fetcher = PrajasaktiFetcher()
 
         # Initializing DropboxManager Class
-        self.dropbox_manager = DropboxManager()
-        self.dropbox_manager.create_folder(self.today_date_str)
+        self.dropbox_manager = DropboxManager(dropbox_client)
+        # Finished papers are uploaded in the background while the next ones are downloaded
+        self.upload_queue = UploadQueue(self.dropbox_manager)
         self.print_ops = {
             "pageRanges": "1-1",
         }
 
-    def send_devtools(self, cmd, params=None):
-        resource = f"/session/{self.driver.session_id}/chromium/send_command_and_get_result"
-        url = self.driver.command_executor._url + resource
-        body = json.dumps({"cmd": cmd, "params": params})
-        response = self.driver.command_executor._request("POST", url, body)
-        if not response:
-            raise Exception(response.get("value"))
-        return response.get("value")
-
-    def get_pdf_from_html(self, target: str, print_options: dict = None):
+    @property
+    def pdf_generator(self):
+        # The browser session is taken from the pool on first use, browserless papers never start one
+        if getattr(self._local, 'pdf_generator', None) is None:
+            with metrics.stage("driver_acquire"):
+                self._local.pdf_generator = PDFGenerator(self.driver_pool.acquire())
+        return self._local.pdf_generator
+
+    @property
+    def driver(self):
+        return self.pdf_generator.get_driver()
+
+    @property
+    def edition_date(self):
+        return getattr(self._local, 'edition_date', None) or self.default_edition_date
+
+    @property
+    def edition_date_str(self):
+        return edition_folder(self.edition_date)
+
+    def run_paper(self, paper, edition_date=None):
+        self._local.pdf_generator = None
+        self._local.edition_date = edition_date
         try:
-            WebDriverWait(self.driver, 2).until(
-                staleness_of(self.driver.find_element(by=By.TAG_NAME, value="html"))
-            )
-        except TimeoutException:
-            calculated_print_options = {
-                "landscape": False,
-                "displayHeaderFooter": False,
-                "printBackground": True,
-                "preferCSSPageSize": True,
-            }
-            print_options = print_options if print_options is not None else self.print_ops
-            calculated_print_options.update(print_options)
-
+            with metrics.paper(paper.__name__), metrics.stage("job"):
+                paper()
+        finally:
+            pdf_generator = self._local.pdf_generator
+            if pdf_generator is not None:
+                self.driver_pool.release(pdf_generator.get_driver(), pdf_generator.page_count)
+            self._local.pdf_generator = None
+            self._local.edition_date = None
+
+    def get_pdf_from_html(self, target: str, print_options: dict = None, paper_name: str = None, reload=None):
+        # Pages captured by an earlier run are reused
+        if self.capture_cache.is_valid(target):
+            print(f"{target} has already been captured.")
+            return
+
+        print_options = print_options if print_options is not None else self.print_ops
+        try:
+            # A failed capture is retried, after reloading the page when it can be opened again by its url
+            retry_policy.call(partial(self.capture_current_page, target, print_options, paper_name),
+                              f"Capture of {target}", page=file_stem(target), on_retry=reload)
+        except Exception as e:
+            print(f"Error in PDF generation: {e}")
+
+    def reload_page(self, after_load=()):
+        reload_current_page(self.driver)
+        for hook in after_load:
+            hook(self.driver)
+
+    def capture_current_page(self, target, print_options=None, paper_name=None):
+        # In image mode the original page scan is used, printing the page is the fallback
+        if self.image_capture.enabled:
+            with metrics.stage("readiness", page=file_stem(target)):
+                wait_for_page_ready(self.driver, paper_name)
             try:
-                result = self.send_devtools("Page.printToPDF", calculated_print_options)
-
-                if "data" not in result:
-                    raise ValueError("Expected 'data' key in result, but it was not found.")
-
-                result_data = base64.b64decode(result["data"])
-                write_to_a_file(result_data, target)
-            except Exception as e:
-                print(f"Error in PDF generation: {e}")
+                with metrics.stage("image_capture", page=file_stem(target)) as record:
+                    captured = self.image_capture.capture(self.driver, target)
+                    record["bytes"] = file_size(target) if captured else 0
+                if captured:
+                    self.pdf_generator.page_count += 1
+                    return
+            except Exception as err:
+                print(f"Couldn't capture the page scan of {target}: {err}")
+        self.pdf_generator.print_current_page(target, print_options, paper_name)
 
     def prepare_file_name(self, paper_name, page_no):
-        return f"{self.today_date_str}/{paper_name}_{page_no}.pdf"
+        # Pages are captured into the capture cache, where they stay until their paper is merged
+        return self.capture_cache.page_path(paper_name, self.edition_date_str, page_no)
+
+    def start_merge(self, paper_name):
+        # Pages are appended to the paper as soon as they are captured
+        return StreamingPdfMerger(f"{self.edition_date_str}/{paper_name}.pdf", remove_pages=False)
 
-    def merge_files(self, files, paper_name):
-        merge_pdfs(files, f"{self.today_date_str}/{paper_name}.pdf")
+    def finish_merge(self, merger, paper_name):
+        paper_file = merger.close()
+        if merger.missing_pages:
+            print(f"{paper_name} is missing {len(merger.missing_pages)} pages, keeping its captured pages for a retry.")
+        else:
+            self.capture_cache.clear(paper_name, self.edition_date_str)
+        return paper_file
 
     def download_prajasakti_paper(self, url, paper_title):
         try:
-            print(f"Reading {paper_title} paper.")
-            praja_sakti_files = []
-            for page_no in range(1, 9):
-                page_name = self.prepare_file_name(paper_title, page_no)
-                praja_sakti_files.append(page_name)
-                self.pdf_generator.get_pdf_from_html(url.format(self.today_date_str, page_no), page_name)
-            self.merge_files(praja_sakti_files, paper_title)
-            print(f"{paper_title} pdf has been generated.")
-            self.dropbox_manager.upload_files(self.today_date_str)
+            with metrics.paper(paper_title), metrics.stage("paper"):
+                self._download_prajasakti_paper(url, paper_title)
         except Exception as err:
             print(f"Exception in {paper_title} paper: {err}")
 
+    def _download_prajasakti_paper(self, url, paper_title):
+        print(f"Reading {paper_title} paper.")
+        with self.start_merge(paper_title) as praja_sakti_merger:
+            pages = {}
+            page_numbers = self.prajasakti_fetcher.discover_page_numbers(url.format(self.edition_date_str, 1))
+            for page_no in page_numbers:
+                page_name = self.prepare_file_name(paper_title, page_no)
+                pages[url.format(self.edition_date_str, page_no)] = page_name
+            page_indexes = {page_name: index for index, page_name in enumerate(pages.values())}
+
+            def add_page(page_name):
+                praja_sakti_merger.add(page_name, page_indexes[page_name])
+
+            # Pages captured by an earlier run are reused
+            for page_url, page_name in list(pages.items()):
+                if self.capture_cache.is_valid(page_name):
+                    add_page(pages.pop(page_url))
+
+            # Pages are fetched over plain HTTP, the browser only renders the ones which couldn't be resolved
+            if self.prajasakti_fetch_mode == 'direct':
+                pages = self.prajasakti_fetcher.fetch_pages(pages, on_fetched=add_page)
+            if pages:
+                def capture_page(page_name):
+                    self.get_pdf_from_html(page_name, paper_name=paper_title, reload=self.reload_page)
+                    add_page(page_name)
+
+                TabPool(self.driver).run([(page_url, page_name) for page_url, page_name in pages.items()], capture_page)
+            paper_file = self.finish_merge(praja_sakti_merger, paper_title)
+        print(f"{paper_title} pdf has been generated.")
+        self.upload_queue.submit(paper_file, self.edition_date_str)
+
     def prajasakthi(self):
         # Get the URLS from config file by section and key
         main_paper_url = self.config['newspapers']['prajasakthi_main_paper_url']
@@ -258,258 +226,236 @@ class NewspaperDownloader:
         main_paper_url = self.config['newspapers']['surya_main_paper_url']
         district_paper_url = self.config['newspapers']['surya_district_paper_url']
 
-        main_paper_name = f"{self.today_date_str}/SuryaMain.pdf"
-        district_paper_name = f"{self.today_date_str}/SuryaDistrict.pdf"
+        main_paper_name = f"{self.edition_date_str}/{SURYA_MAIN}.pdf"
+        district_paper_name = f"{self.edition_date_str}/{SURYA_DT}.pdf"
 
         main_paper_xpath_expression = "//a[@data-linktype='edition-link' and @data-cat_ids='8']"
         district_paper_xpath_expression = "//a[@data-linktype='edition-link' and @data-cat_ids='18']"
 
-        download_surya_pdf_files(self.driver, main_paper_url, main_paper_name, main_paper_xpath_expression)
-        download_surya_pdf_files(self.driver, district_paper_url, district_paper_name, district_paper_xpath_expression)
-
-        self.dropbox_manager.upload_files(self.today_date_str)
-
-    def andhra_jyothi(self):
-        try:
-            abn_date = self.today_date.strftime("%d/%m/%Y")
-
-            # Get the URLS from config file by section and key
-            url = self.config.get('newspapers', 'abn_paper_url')
-            url = url.format(abn_date)
-
-            load_page(self.driver, url)
-            current_url = self.driver.current_url
-
-            accept_cookies("gdprContinue", self.driver)
-            hide_social_share_button(self.driver)
-
-            page_no = 1
-            abn_files = []
-
-            print(f"Reading {ANDHARAJOTHI} paper.")
-            self.driver.get(current_url)
-            hide_social_share_button(self.driver)
-            add_right_zero(self.driver)
-            while page_no <= 7:
-                page_name = self.prepare_file_name(ANDHARAJOTHI, str(page_no))
-                self.get_pdf_from_html(page_name)
-                # self.pdf_generator.get_pdf_from_html(current_url, page_name)
-                abn_files.append(page_name)
-
-                if page_no != 7:
-                    navigate_to_next_page(self.driver, current_url)
-                    add_right_zero_to_elements(self.driver)
-                    current_url = self.driver.current_url
-
-                page_no += 1
-                time.sleep(2)  # Adding a short delay to avoid overwhelming the page with rapid navigation
-
-            self.merge_files(abn_files, ANDHARAJOTHI)
-            print(f"{ANDHARAJOTHI} pdf has been generated.")
-            self.dropbox_manager.upload_files(self.today_date_str)
-
-        except Exception as err:
-            print(f"Exception in {ANDHARAJOTHI} paper: {err}")
-
-    def sakshi(self):
-        try:
-            sakshi_date = self.today_date.strftime("%d/%m/%Y")
-
-            # Get the URLS from config file by section and key
-            url = self.config['newspapers']['sakshi_paper_url']
-            print(self.config)
-            url = url.format(sakshi_date)
-
-            load_page(self.driver, url)
-            current_url = self.driver.current_url
-
-            find_and_click_buttons(self.driver)
-            accept_cookies("gdprContinue", self.driver)
-            skip_ads(self.driver)
-            hide_social_share_button(self.driver)
-
-            page_no = 1
-            sakshi_files = []
-
-            print(f"Reading {SAKSHI} paper.")
-            self.driver.get(current_url)
-            hide_social_share_button(self.driver)
-            add_right_zero(self.driver)
-            while page_no <= 8:
-                page_name = self.prepare_file_name(SAKSHI, str(page_no))
-                self.get_pdf_from_html(page_name)
-                # self.pdf_generator.get_pdf_from_html(current_url, page_name)
-                sakshi_files.append(page_name)
-
-                if page_no != 8:
-                    navigate_to_next_page(self.driver, current_url)
-                    add_right_zero_to_elements(self.driver)
-                    current_url = self.driver.current_url
-
-                page_no += 1
-                time.sleep(2)  # Adding a short delay to avoid overwhelming the page with rapid navigation
-
-            self.merge_files(sakshi_files, SAKSHI)
-            print(f"{SAKSHI} pdf has been generated.")
-            self.dropbox_manager.upload_files(self.today_date_str)
-
-        except Exception as err:
-            print(f"Exception in {SAKSHI} paper: {err}")
-
-    def eenadu(self):
-        try:
-            eenadu_date = self.today_date.strftime("%d/%m/%Y")
-
-            # Get the URLS from config file by section and key
-            url = self.config['newspapers']['eenadu_paper_url']
-            url = url.format(eenadu_date)
-
-            self.driver.get(url)
-            current_url = self.driver.current_url
+        # The browser only looks up the pdf links, both editions are then downloaded at the same time
+        pdf_files = {}
+        for url, filename, xpath_expression in ((main_paper_url, main_paper_name, main_paper_xpath_expression),
+                                                (district_paper_url, district_paper_name,
+                                                 district_paper_xpath_expression)):
+            try:
+                with metrics.stage("link_lookup", paper=file_stem(filename)):
+                    pdf_files[get_surya_pdf_href(self.driver, url, xpath_expression)] = filename
+            except Exception as err:
+                print(f"Exception while downloading {filename}: {err}")
 
-            page_no = 1
-            eenadu_files = []
-
-            print(f"Reading {EENADU} paper.")
-            self.driver.get(current_url)
-            no_of_pages = get_number_of_pages(self.driver)
-            while page_no <= no_of_pages:
-                page_name = self.prepare_file_name(EENADU, str(page_no))
-                self.get_pdf_from_html(page_name)
-                eenadu_files.append(page_name)
-
-                if page_no != no_of_pages:
-                    navigate_to_next_eenadu_page(self.driver)
-                page_no += 1
-                time.sleep(3)  # Adding a short delay to avoid overwhelming the page with rapid navigation
-
-            self.merge_files(eenadu_files, EENADU)
-            print(f"{EENADU} pdf has been generated.")
-            self.dropbox_manager.upload_files(self.today_date_str)
-        except Exception as err:
-            print(f"Exception in {EENADU} paper: {err}")
+        for filename, downloaded in self.http_downloader.download_all(pdf_files).items():
+            if downloaded:
+                self.upload_queue.submit(filename, self.edition_date_str)
 
     def vaartha(self):
         try:
-            vaartha_paper_name = f"{self.today_date_str}/Vaartha.pdf"
+            vaartha_paper_name = f"{self.edition_date_str}/{VAARTHA_MAIN}.pdf"
 
             # Get the URLS from config file by section and key
             # url = self.config['newspapers']['vaartha_paper_url']
             # url = "https://epaper.vaartha.com/epaper/default/open?id=20"
-            url = "https://epaper.vaartha.com/"
-
-            self.driver.get(url)
-            # Locate the link by its text
-            element = self.driver.find_element(By.LINK_TEXT, "Ongole main")
-            # Get the href attribute value
-            href_value = element.get_attribute("href")
-            self.driver.get(href_value)
-            element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "btn-pdfdownload")))
-            pdf_href_value = element.get_attribute("href")
-            response = requests.get(pdf_href_value)
-            if response.status_code == 200:
-                with open(vaartha_paper_name, 'wb') as f:
-                    f.write(response.content)
-                print(f"{vaartha_paper_name} downloaded successfully.")
-            else:
-                print(f"Failed to download {vaartha_paper_name}.")
-            self.dropbox_manager.upload_files(self.today_date_str)
+            url = self.config.get('newspapers', 'vaartha_home_url', fallback="https://epaper.vaartha.com/")
+
+            with metrics.stage("link_lookup", paper=file_stem(vaartha_paper_name)):
+                open_url(self.driver, url)
+                # Locate the link by its text
+                element = self.driver.find_element(By.LINK_TEXT, "Ongole main")
+                # Get the href attribute value
+                href_value = element.get_attribute("href")
+                open_url(self.driver, href_value)
+                element = wait_until(self.driver, EC.presence_of_element_located((By.CLASS_NAME, "btn-pdfdownload")),
+                                     "pdf_link", 10)
+                pdf_href_value = element.get_attribute("href")
+            if self.http_downloader.download(pdf_href_value, vaartha_paper_name):
+                self.upload_queue.submit(vaartha_paper_name, self.edition_date_str)
         except Exception as err:
             print(f"Exception in {VAARTHA} paper: {err}")
 
-
-    def visalandra(self):
+    def download_paper(self, adapter):
+        paper_name = adapter.paper_name
         try:
-            visalandra_date = self.today_date.strftime("%d/%m/%Y")
-
-            # Get the URLS from config file by section and key
-            url = self.config['newspapers']['visalandra_paper_url']
-            url = url.format(visalandra_date)
-
-            self.driver.get(url)
-            current_url = self.driver.current_url
-            accept_cookies("gdprContinue", self.driver)
-            hide_social_share_button(self.driver)
-            add_right_zero(self.driver)
-
-            page_no = 1
-            visalandra_files = []
-
-            print(f"Reading {VISALANDRA} paper.")
-            while page_no <= 8:
-                page_name = self.prepare_file_name(VISALANDRA, str(page_no))
-                self.get_pdf_from_html(page_name)
-                visalandra_files.append(page_name)
-
-                if page_no != 8:
-                    navigate_to_next_page(self.driver, current_url)
-                    add_right_zero_to_elements(self.driver)
-                    current_url = self.driver.current_url
-
-                page_no += 1
-
-            self.merge_files(visalandra_files, VISALANDRA)
-            print(f"{VISALANDRA} pdf has been generated.")
-            self.dropbox_manager.upload_files(self.today_date_str)
+            with metrics.paper(paper_name), metrics.stage("paper"):
+                self._download_paper(adapter)
         except Exception as err:
-            print(f"Exception in {VISALANDRA} paper: {err}")
+            print(f"Exception in {paper_name} paper: {err}")
 
-    def andhra_prabha(self):
-        try:
-            andhra_prabha_date = self.today_date.strftime("%d/%m/%Y")
+    def _download_paper(self, adapter):
+        """
+        Reads a page by page e-paper described by a SiteAdapter, either by opening every page by its url
+        in parallel tabs or page by page using the Next_Page navigation.
+        """
+        paper_name = adapter.paper_name
+        paper_date = self.edition_date.strftime("%d/%m/%Y")
 
-            # Get the URLS from config file by section and key
-            url = self.config['newspapers']['andhra_prabha_paper_url']
-            url = url.format(andhra_prabha_date)
+        # Get the URLS from config file by section and key
+        url = self.config.get('newspapers', adapter.url_key)
+        url = url.format(paper_date)
 
-            load_page(self.driver, url)
+        with metrics.stage("navigation"):
+            if adapter.wait_for_pgid:
+                load_page(self.driver, url)
+            else:
+                open_url(self.driver, url)
             current_url = self.driver.current_url
 
-            accept_cookies("gdprContinue", self.driver)
-            hide_social_share_button(self.driver)
+            for popup in adapter.popups:
+                popup(self.driver)
+
+            print(f"Reading {paper_name} paper.")
+            if adapter.reload:
+                open_url(self.driver, current_url)
+            for after_load in adapter.after_load:
+                after_load(self.driver)
+
+        # The page list is read once up front, the configured count is only a fallback
+        with metrics.stage("discovery"):
+            page_ids = discover_page_ids(self.driver, adapter)
+        no_of_pages = len(page_ids) or adapter.pages
+        if not no_of_pages:
+            raise ValueError("Couldn't find the pages of the edition.")
+        with self.start_merge(paper_name) as paper_merger:
+            # The ids are only known to be pgids when the page open is one of them, else the pages are walked
+            if adapter.direct_pages and get_page_id(current_url) in page_ids:
+                page_urls = [build_page_url(current_url, page_id) for page_id in page_ids]
+                self.capture_pages_in_tabs(adapter, page_urls, paper_merger)
+            else:
+                self.capture_pages_by_navigation(adapter, no_of_pages, paper_merger)
+
+            paper_file = self.finish_merge(paper_merger, paper_name)
+        print(f"{paper_name} pdf has been generated.")
+        self.upload_queue.submit(paper_file, self.edition_date_str)
+
+    def capture_pages_by_navigation(self, adapter, no_of_pages, paper_merger):
+        current_url = self.driver.current_url
+        for page_no in range(1, no_of_pages + 1):
+            page_name = self.prepare_file_name(adapter.paper_name, str(page_no))
+            self.get_pdf_from_html(page_name, paper_name=adapter.paper_name)
+            paper_merger.add(page_name)
+
+            if page_no != no_of_pages:
+                try:
+                    next_page = str(page_no + 1)
+                    retry_policy.call(partial(self.go_to_next_page, adapter, current_url, next_page),
+                                      f"Navigation to page {next_page} of {adapter.paper_name}", page=next_page)
+                except Exception as err:
+                    print(f"Couldn't find the next page..! Error: {err}")
+                for after_navigate in adapter.after_navigate:
+                    after_navigate(self.driver)
+                current_url = self.driver.current_url
+
+    def go_to_next_page(self, adapter, current_url, page):
+        with metrics.stage("navigation", page=page):
+            adapter.navigate(self.driver, current_url)
+
+    def capture_pages_in_tabs(self, adapter, page_urls, paper_merger):
+        """
+        Opens the pages directly by their url in a pool of tabs, so that they load at the same time
+        instead of waiting for the previous page to be captured.
+        """
+        pages = []
+        for page_no, page_url in enumerate(page_urls, start=1):
+            page_name = self.prepare_file_name(adapter.paper_name, str(page_no))
+            # Pages captured by an earlier run don't need a tab
+            if self.capture_cache.is_valid(page_name):
+                paper_merger.add(page_name, page_no - 1)
+            else:
+                pages.append((page_url, (page_no, page_name)))
 
-            page_no = 1
-            andhra_prabha_files = []
+        def capture_page(page):
+            page_no, page_name = page
+            for after_load in adapter.after_load:
+                after_load(self.driver)
+            self.get_pdf_from_html(page_name, paper_name=adapter.paper_name,
+                                   reload=partial(self.reload_page, adapter.after_load))
+            paper_merger.add(page_name, page_no - 1)
 
-            print(f"Reading {ANDHRA_PRABHA} paper.")
-            self.driver.get(current_url)
-            hide_social_share_button(self.driver)
-            add_right_zero(self.driver)
-            while page_no <= 12:
-                page_name = self.prepare_file_name(ANDHRA_PRABHA, str(page_no))
-                self.get_pdf_from_html(page_name)
-                # self.pdf_generator.get_pdf_from_html(current_url, page_name)
-                andhra_prabha_files.append(page_name)
+        TabPool(self.driver).run(pages, capture_page)
 
-                if page_no != 12:
-                    navigate_to_next_page(self.driver, current_url)
-                    add_right_zero_to_elements(self.driver)
-                    current_url = self.driver.current_url
+    def andhra_jyothi(self):
+        self.download_paper(SITE_ADAPTERS[ANDHARAJOTHI])
 
-                page_no += 1
-                time.sleep(3)  # Adding a short delay to avoid overwhelming the page with rapid navigation
+    def sakshi(self):
+        self.download_paper(SITE_ADAPTERS[SAKSHI])
 
-            self.merge_files(andhra_prabha_files, ANDHRA_PRABHA)
-            print(f"{ANDHRA_PRABHA} pdf has been generated.")
-            self.dropbox_manager.upload_files(self.today_date_str)
+    def eenadu(self):
+        self.download_paper(SITE_ADAPTERS[EENADU])
 
-        except Exception as err:
-            print(f"Exception in {ANDHRA_PRABHA} paper: {err}")
-
-    def execute_download(self):
-        self.prajasakthi()
-        self.andhra_prabha()
-        self.surya()
-        self.visalandra()
-        self.vaartha()
-        self.eenadu()
-        self.sakshi()
-        self.andhra_jyothi()
+    def visalandra(self):
+        self.download_paper(SITE_ADAPTERS[VISALANDRA])
+
+    def andhra_prabha(self):
+        self.download_paper(SITE_ADAPTERS[ANDHRA_PRABHA])
+
+    def is_completed(self, paper, edition_date):
+        # A paper uploaded with pages missing still has its captured pages in the cache and is run again
+        folder = edition_folder(edition_date)
+        return all(self.dropbox_manager.is_uploaded(f"{folder}/{paper_file}.pdf")
+                   and not self.capture_cache.has_pages(paper_file, folder) for paper_file in PAPER_FILES[paper])
+
+    def execute_download(self, paper_names=None, dates=None):
+        """
+        Downloads every paper, or only the ones named in paper_names, of tomorrow's edition or of every
+        given date (backfill). Each (paper, date) is a job of the scheduler, papers already in Dropbox
+        for a date are skipped.
+        """
+        papers = {
+            "prajasakthi": self.prajasakthi,
+            "andhra_prabha": self.andhra_prabha,
+            "surya": self.surya,
+            "visalandra": self.visalandra,
+            "vaartha": self.vaartha,
+            "eenadu": self.eenadu,
+            "sakshi": self.sakshi,
+            "andhra_jyothi": self.andhra_jyothi,
+        }
+        if paper_names is not None:
+            papers = {name: paper for name, paper in papers.items() if name in paper_names}
+        backfill = dates is not None
+        dates = dates or [self.default_edition_date]
+
+        jobs = {}
+        for edition_date in dates:
+            for name, paper in papers.items():
+                if name in LATEST_EDITION_ONLY and edition_date != self.default_edition_date:
+                    print(f"{name} only has its latest edition, skipping {edition_date}.")
+                elif self.skip_completed and self.is_completed(name, edition_date):
+                    print(f"{name} of {edition_date} is already in Dropbox, skipping it.")
+                else:
+                    jobs[(name, edition_folder(edition_date))] = partial(self.run_paper, paper, edition_date)
+
+        folders = sorted({folder for name, folder in jobs})
+        for folder in folders:
+            # The papers are written to the local folder right away, the Dropbox folders are set up in the background
+            os.makedirs(folder, exist_ok=True)
+            # A daily run replaces the previous edition in Dropbox, a backfill keeps every date
+            self.upload_queue.create_folder(folder, remove_previous=not backfill)
+        try:
+            self.driver_pool.warm_up()
+            self.scheduler.run(jobs)
+        finally:
+            # Never leave Chrome processes behind
+            self.driver_pool.close()
+            self.upload_queue.join()
+            latency_history.save()
+            metrics.write_report()
+            metrics.print_summary()
         # time.sleep(600)
-        remove_folder()
+        for folder in folders:
+            remove_folder(folder)
 
 
 # Usage:
-downloader = NewspaperDownloader()
-downloader.execute_download()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Downloads the e-papers and uploads them to Dropbox.")
+    parser.add_argument("--from", dest="start", type=parse_edition_date,
+                        help="backfills the editions from this date (yyyy-mm-dd)")
+    parser.add_argument("--to", dest="end", type=parse_edition_date,
+                        help="last date of the backfill, tomorrow's edition by default")
+    parser.add_argument("--papers", nargs="+", choices=list(PAPER_FILES), help="papers to download, all by default")
+    args = parser.parse_args()
+
+    downloader = NewspaperDownloader()
+    edition_range = None
+    if args.start:
+        edition_range = edition_dates(args.start, args.end or downloader.default_edition_date, downloader.max_days)
+    downloader.execute_download(args.papers, edition_range)